@@ -1,14 +1,21 @@
 import pygame
+from time import perf_counter
 from vector2d import Vector2D
-from random import uniform
+from combat_log import KILLS, HITS, ALL
+
+WANDER_WEIGHT = 0.8  # calculate has always used this rather than the group's wander weight
+MODES = ('wander', 'fight', 'carry_food', 'follow_path', 'start_attack')
+MODE_CODES = {mode: code for code, mode in enumerate(MODES)}  # Small ints for the engine and saved state
 
 class Agent:
     def __init__(self, world, position, group, radius=5, color=(255, 0, 0), scale=1, mass=0.8, mode='wander'):
         self.world = world
+        self.id = world.register_agent(self)
         self.mode = mode
         self.group = group
         self.position = position
-        self.velocity = Vector2D(uniform(-1, 1), uniform(-1, 1))
+        velocity_rng = world.rng.velocity
+        self.velocity = Vector2D(velocity_rng.uniform(-1, 1), velocity_rng.uniform(-1, 1))
         self.radius = radius
         self.color = color
         self.scale = Vector2D(scale, scale)
@@ -16,11 +23,6 @@ class Agent:
         self.health = 12
         self.alive = True
 
-        # Behavior weights
-        self.cohesion_weight = 1.0
-        self.separation_weight = 1.0
-        self.alignment_weight = 1.0
-        self.wander_weight = 1.0
         self.neighbors = []
 
         # Initialize wander properties
@@ -30,50 +32,71 @@ class Agent:
         self.wander_jitter = 2.0 * scale
 
         # Limits
-        self.max_speed = 10.0 * scale
+        self.base_max_speed = 10.0 * scale  # Used while the group has no max_speed of its own
         self.max_force = 500.0
 
         # Goals
         self.carrying_food = None
         self.target = None
         self.path = []
+        self.path_request = None  # Waiting on World.path_planner
         self.world_target = None
         self.enemy = None
 
-    def update(self, delta_time):
+        # Scratch vectors reused every frame so steering doesn't allocate, see the *_into methods on Vector2D
+        self._steering = Vector2D()  # Final force handed back to update
+        self._force = Vector2D()  # Result of the current behaviour (cohesion, separation, ...)
+        self._seek = Vector2D()  # Result of seek
+        self._direction = Vector2D()
+        self._side = Vector2D()
+
+    def update(self, delta_time, profiler=None):
+        ''' profiler: World.profiler when it is enabled, gets this update's time split into phases '''
+        if profiler is not None:
+            mark = perf_counter()
+
         # Update neighbors
         self.neighbors = self.get_neighbors(15)  # Neighbour detection radius
+        if profiler is not None:
+            mark = profiler.lap('neighbors', mark)
 
         # Calculate the steering force
         steering_force = self.state_machine()
         if steering_force is None:
-            steering_force = Vector2D(0, 0)
+            steering_force = self._steering.set(0., 0.)
         steering_force.truncate(self.max_force)
+        if profiler is not None:
+            mark = profiler.lap('state_machine', mark)
 
-        # Apply the force to acceleration
-        acceleration = steering_force / self.mass
-
-        # Update velocity and position
-        self.velocity += acceleration * delta_time
+        # Apply the force to acceleration (force / mass) and update velocity and position
+        self.velocity.add_scaled(steering_force, delta_time / self.mass)
         self.velocity.truncate(self.max_speed)
-        self.position += self.velocity * delta_time
+        self.position.add_scaled(self.velocity, delta_time)
+        if profiler is not None:
+            mark = profiler.lap('integration', mark)
 
         # Ensure the agent stays within bounds
         self.check_bounds()
         self.check_wall_collision()
         # Check for food collision
         self.check_food_collision()
+        if profiler is not None:
+            profiler.lap('collisions', mark)
 
     def state_machine(self):
         if not self.alive:
-            return Vector2D(0, 0)
+            return self._steering.set(0., 0.)
 
         if self.mode == 'carry_food':
             x, y, width, height = self.group.king_zone
-            self.target = Vector2D(x + width / 2, y + height / 2)
+            if self.target is None:
+                self.target = Vector2D()
+            self.target.set(x + width / 2, y + height / 2)
 
             # If food already in zone, drop it
             if self.is_in_king_zone():
+                if self.carrying_food:
+                    self.group.food_delivered += 1
                 self.drop_food()
                 self.mode = 'wander'
                 self.target = None
@@ -89,49 +112,50 @@ class Agent:
         elif self.mode == 'fight':
             if not self.enemy or not self.enemy.alive:
                 self.mode = 'wander'
-                return Vector2D(0, 0)
+                return self._steering.set(0., 0.)
 
             if self.position.distance(self.enemy.position) < self.radius * 5:
                 self.attack_agent(self.enemy)
-                return Vector2D(0, 0)
+                return self._steering.set(0., 0.)
             else:
                 return self.seek(self.enemy.position)
 
         elif self.mode == 'wander':
             self.target = None
-            if len(self.neighbors) > 1 and not self.is_in_king_zone():
-                if self.enemy and self.enemy.alive:
-                    self.mode = 'fight'
-                else:
-                    self.enemy = self.detect_enemy()
-                    if self.enemy:
-                        self.mode = 'fight'
-                        self.notify_allies_to_attack(self.enemy)
+            self.look_for_enemies()
             return self.calculate(self.neighbors)
 
         elif self.mode == 'start_attack':
-            if not self.path:
-                # Set the target for the attack
-                self.path = self.world.plan_path(self.position, self.world_target)
+            # Path to the attack target is requested by pathfinder
             force = self.pathfinder(self.world_target)
             if force is None or (force.x == 0 and force.y == 0):
                 self.mode = 'wander'
             return force
 
-        return Vector2D(0, 0)  # Default return value
+        return self._steering.set(0., 0.)  # Default return value
+
+    def look_for_enemies(self):
+        # Switch to fighting when out in the field with company and an enemy is close
+        if len(self.neighbors) > 1 and not self.is_in_king_zone():
+            if self.enemy and self.enemy.alive:
+                self.mode = 'fight'
+            else:
+                self.enemy = self.detect_enemy()
+                if self.enemy:
+                    self.mode = 'fight'
+                    self.notify_allies_to_attack(self.enemy)
 
     def calculate(self, neighbors):
         # Calculate the current steering force
         delta = 5.0
+        steering_force = self._steering.set(0., 0.)
 
-        cohesion_force = self.cohesion(neighbors) * self.cohesion_weight
-        separation_force = self.separation(neighbors) * self.separation_weight
-        alignment_force = self.alignment(neighbors) * self.alignment_weight
+        # Each behaviour writes into a scratch vector, so fold it in before calling the next one
+        steering_force.add_scaled(self.cohesion(neighbors), self.cohesion_weight)
+        steering_force.add_scaled(self.separation(neighbors), self.separation_weight)
+        steering_force.add_scaled(self.alignment(neighbors), self.alignment_weight)
 
-        self.wander_weight = 0.8
-        wander_force = self.wander(delta) * self.wander_weight
-
-        steering_force = cohesion_force + separation_force + alignment_force + wander_force
+        steering_force.add_scaled(self.wander(delta), WANDER_WEIGHT)
 
         steering_force.truncate(self.max_force)
 
@@ -153,7 +177,7 @@ class Agent:
             self.velocity.y *= -1
 
     def check_wall_collision(self):
-        for wall in self.world.walls:
+        for wall in self.world.wall_index.near(self.position):
             if self.inside_wall(wall.rect):
                 if self.position.x < wall.rect.left:
                     self.position.x = wall.rect.left - self.radius
@@ -178,11 +202,47 @@ class Agent:
         distance_squared = (distance_x * distance_x) + (distance_y * distance_y)
         return distance_squared < (self.radius * self.radius)
 
-    def apply_behavior_weights(self, cohesion, separation, alignment, wander):
-        self.cohesion_weight = cohesion
-        self.separation_weight = separation
-        self.alignment_weight = alignment
-        self.wander_weight = wander
+    @property
+    def enemy(self):
+        ''' The agent being chased, None once it has been removed from its group '''
+        return None if self.enemy_id is None else self.world.agents_by_id.get(self.enemy_id)
+
+    @enemy.setter
+    def enemy(self, value):
+        self.enemy_id = None if value is None else value.id
+
+    def kill(self):
+        ''' Mark dead, the group drops it in one batch at the end of its update '''
+        if self.alive:
+            self.alive = False
+            self.group.dead.append(self)
+            self.drop_path_request()
+
+    # Behaviour weights and the speed limit are shared by the whole group, see AgentGroup.apply_behavior_weights
+    @property
+    def cohesion_weight(self):
+        return self.group.cohesion_weight
+
+    @property
+    def separation_weight(self):
+        return self.group.separation_weight
+
+    @property
+    def alignment_weight(self):
+        return self.group.alignment_weight
+
+    @property
+    def wander_weight(self):
+        return self.group.wander_weight
+
+    @property
+    def max_speed(self):
+        max_speed = self.group.max_speed
+        return self.base_max_speed if max_speed is None else max_speed
+
+    @max_speed.setter
+    def max_speed(self, value):
+        self.base_max_speed = value
 
     def render(self, screen):
         pygame.draw.circle(screen, self.color, (int(self.position.x), int(self.position.y)), self.radius)
@@ -190,95 +250,132 @@ class Agent:
     def detect_enemy(self):
         ''' Detect if an enemy is within a radius around the agent '''
         detection_radius = 8 * self.scale.x # 3
-        for enemy in self.world.get_other_group_agents(self.group):
+        for enemy in self.world.get_agents_in_radius(self.position, detection_radius, self.group, 'enemy'):
             if enemy and enemy != self:
-                distance_to_enemy = (enemy.position - self.position).length()
+                distance_to_enemy = self.position.distance(enemy.position)
                 if distance_to_enemy < detection_radius:
                     return enemy
         return None
 
     def get_neighbors(self, radius):
-        neighbors = []
-        for agent in self.group.agents:
-            if agent != self and self.position.distance(agent.position) <= radius:
-                neighbors.append(agent)
+        neighbors = self.world.get_agents_in_radius(self.position, radius, self.group, 'same')
+        if self in neighbors:
+            neighbors.remove(self)
         return neighbors
 
     # Group steering behaviors
-    def calculate_average_heading(self, neighbors):
+    # These return one of the agent's scratch vectors, use the result before calling another behaviour
+    def calculate_average_heading(self, neighbors, out=None):
+        if out is None:
+            out = Vector2D()
+        out.set(0., 0.)
         if not neighbors:
-            return Vector2D()
+            return out
 
-        sum_heading = Vector2D()
+        heading = self._direction
         for agent in neighbors:
-            sum_heading += agent.velocity.get_normalised()
+            out += agent.velocity.normalised_into(heading)
 
-        return sum_heading / len(neighbors)
+        out /= len(neighbors)
+        return out
 
-    def calculate_center_position(self, neighbors):
+    def calculate_center_position(self, neighbors, out=None):
+        if out is None:
+            out = Vector2D()
+        out.set(0., 0.)
         if not neighbors:
-            return Vector2D()
-        sum_pos = Vector2D()
+            return out
 
         for agent in neighbors:
-            sum_pos += agent.position
+            out += agent.position
 
-        return sum_pos / len(neighbors)
+        out /= len(neighbors)
+        return out
 
     def cohesion(self, neighbors):
         if not neighbors:
-            return Vector2D()
+            return self._force.set(0., 0.)
 
-        center_of_mass = self.calculate_center_position(neighbors)
-        desired_velocity = (center_of_mass - self.position).normalise() * self.max_speed
+        # desired velocity = (center of mass - position).normalise() * max_speed
+        force = self.calculate_center_position(neighbors, self._force)
+        force -= self.position
+        force.normalise()
+        force *= self.max_speed
 
-        return desired_velocity - self.velocity
+        force -= self.velocity
+        return force
 
     def separation(self, neighbors):
+        force = self._force.set(0., 0.)
         if not neighbors:
-            return Vector2D()
+            return force
 
-        separation_force = Vector2D()
+        direction = self._direction
         for agent in neighbors:
-            direction = self.position - agent.position
+            self.position.sub_into(agent.position, direction)
             distance = direction.length()
 
             if distance > 0:
-                separation_force += direction.normalise() * (1.0 / distance)
+                # direction.normalise() * (1.0 / distance)
+                force.add_scaled(direction, 1.0 / (distance * distance))
 
-        return separation_force
+        return force
 
     def alignment(self, neighbors):
         if not neighbors:
-            return Vector2D()
+            return self._force.set(0., 0.)
 
-        average_heading = self.calculate_average_heading(neighbors)
-        return average_heading - self.velocity.get_normalised()
+        force = self.calculate_average_heading(neighbors, self._force)
+        force -= self.velocity.normalised_into(self._direction)
+        return force
 
     def start_attack(self, target):
         self.world_target = target
+        self.drop_path_request()
         self.mode = 'start_attack'
 
+    def drop_path_request(self):
+        if self.path_request is not None:
+            self.world.path_planner.release(self.path_request)
+            self.path_request = None
+
     # Individual steering behaviors
     def wander(self, delta):  # For random wandering
         wt = self.wander_target
         jitter_tts = self.wander_jitter * delta
-        wt += Vector2D(uniform(-1, 1) * jitter_tts, uniform(-1, 1) * jitter_tts)
+        jitter = self.group.jitter.values  # Drawn in bulk once per group update
+        i = 2 * self.slot
+        if i + 1 >= len(jitter):  # Called outside AgentGroup.update
+            jitter = self.group.jitter.refill(len(self.group.agents))
+        wt.x += jitter[i] * jitter_tts
+        wt.y += jitter[i + 1] * jitter_tts
         wt.normalise()
         wt *= self.wander_radius
-        target = wt + Vector2D(self.wander_distance, 0)
-        wld_target = self.world.transform_points([target], self.position, self.velocity.get_normalised(), self.velocity.get_normalised().perp(), self.scale)
-        return self.seek(wld_target[0])
+        target = self._force.set(wt.x + self.wander_distance, wt.y)
+        heading = self.velocity.normalised_into(self._direction)
+        self.world.transform_point(target, self.position, heading, heading.perp_into(self._side), self.scale, out=target)
+        return self.seek(target)
 
     def seek(self, target_pos):  # Use for targeting enemies
-        desired_vel = (target_pos - self.position).normalise() * self.max_speed
-        return desired_vel - self.velocity
+        # desired velocity = (target_pos - position).normalise() * max_speed
+        force = target_pos.sub_into(self.position, self._seek)
+        force.normalise()
+        force *= self.max_speed
+        force -= self.velocity
+        return force
 
     def pathfinder(self, target):  # For exploring, seems to work for now
         if not self.path:
-            self.path = self.world.plan_path(self.position, target)  # Use A* to plan path
-            if not self.path:  # If no path is found, return an empty vector
-                print("DEBUG: NO PATH FOUND")
+            request = self.path_request
+            if request is None or request.goal_cell != self.world.world_to_grid(target):
+                self.drop_path_request()
+                request = self.path_request = self.world.path_planner.request(self.position, target)
+            if not request.done:
+                return self.seek(target)  # Head straight for it until the planner gets to us
+            self.path = list(request.path)
+            self.path_request = None
+            if not self.path:  # No path found, head straight for it
+                self.world.path_stats.agents_without_path += 1
                 return self.seek(target)
 
         if self.path:
@@ -286,11 +383,10 @@ class Agent:
             if self.position.distance(next_pos) < self.radius:
                 self.path.pop(0)
                 if not self.path:  # Path is completed
-                    return Vector2D(0, 0)
+                    return self._steering.set(0., 0.)
             return self.seek(next_pos)
 
-        print("DEBUG: PATHFINDER CALLED WITH NO PATH")
-        return Vector2D(0, 0)
+        return self._steering.set(0., 0.)
 
     # Goals and objectives --------------------------------------------------------------------------------------------------
     # FOOD
@@ -302,7 +398,8 @@ class Agent:
 
     def check_food_collision(self):
         if self.carrying_food is None:
-            for food in self.world.food:
+            world = self.world
+            for food in world.food_grid.query(self.position, self.radius + world.max_food_radius):
                 if self.position.distance(food.position) < self.radius + food.radius and not food.is_in_king_zone(self.group):
                     if food.being_held_by is None:
                         food.add_touching_agent(self)
@@ -323,22 +420,28 @@ class Agent:
     # Attack
     def notify_allies_to_attack(self, enemy):
         # Notify nearby allies to attack the detected enemy
+        log = self.world.combat_log
         for agent in self.neighbors:
             if agent.group == self.group:
                 agent.enemy = enemy
                 agent.mode = 'fight'
-                print("Now Chasing", agent.enemy.position)
+                if log.level >= ALL:
+                    log.record('notify', agent, enemy)
                 agent.seek(enemy.position)
 
     def attack_agent(self, enemy):
-        print("Attacking")
+        log = self.world.combat_log
         if self.position.distance(enemy.position) < self.radius * 3:
             enemy.health -= 3
-            print(f"Enemy health: {enemy.health}")
+            if log.level >= HITS:
+                log.record('hit', self, enemy, 3)
             if enemy.health <= 0:
-                enemy.alive = False
+                enemy.kill()
                 self.enemy = None
-                print("Enemy killed")
+                if log.level >= KILLS:
+                    log.record('kill', self, enemy)
+        elif log.level >= ALL:
+            log.record('miss', self, enemy)
 
 
 class KingAgent(Agent):
@@ -364,9 +467,15 @@ class KingAgent(Agent):
             self.velocity.y *= -1
             
     def attack_agent(self, enemy):
-        print("King Attacking")
+        log = self.world.combat_log
         if self.position.distance(enemy.position) < self.radius * 3:
             enemy.health -= 6
+            if log.level >= HITS:
+                log.record('hit', self, enemy, 6)
             if enemy.health <= 0:
-                enemy.alive = False
-                self.enemy = None
\ No newline at end of file
+                enemy.kill()
+                self.enemy = None
+                if log.level >= KILLS:
+                    log.record('kill', self, enemy)
+        elif log.level >= ALL:
+            log.record('miss', self, enemy)
\ No newline at end of file
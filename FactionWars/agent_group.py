@@ -1,9 +1,9 @@
 from agent import Agent, KingAgent
 from vector2d import Vector2D
-from random import randint
+from random_streams import JitterBuffer
 
 class AgentGroup:
-    def __init__(self, world, num_agents, color, cohesion_weight, separation_weight, alignment_weight, wander_weight, king_zone=None):
+    def __init__(self, world, num_agents, color, cohesion_weight, separation_weight, alignment_weight, wander_weight, king_zone=None, engine=None):
         self.agents = []
         self.world = world
         self.color = color
@@ -11,47 +11,83 @@ class AgentGroup:
         self.separation_weight = separation_weight
         self.alignment_weight = alignment_weight
         self.wander_weight = wander_weight
+        self.max_speed = None  # When set, overrides every agent's own max_speed
         self.king_zone = king_zone
         self.goal = None
         self.world_target = None
+        self.food_delivered = 0
+        self.dead = []  # Killed since the last remove_dead, see Agent.kill
+        self.jitter = JitterBuffer(world.rng.wander)  # Wander jitter for every agent, refilled each update
+
+        # Optional NumPy structure-of-arrays engine, agents become views over its rows
+        self.engine = None
+        agent_class, king_class = Agent, KingAgent
+        if engine == 'array':
+            from array_engine import ArrayFlockEngine, ArrayAgent, ArrayKingAgent
+            self.engine = ArrayFlockEngine(self, num_agents + 1)
+            agent_class, king_class = ArrayAgent, ArrayKingAgent
+        elif engine is not None:
+            raise ValueError(f"Unknown engine: {engine}")
         
         if king_zone:
             king_pos = self.get_valid_position(king_zone)
-            king = KingAgent(world, king_pos, self, self.king_zone, color=color)
-            self.agents.append(king)
+            king = king_class(world, king_pos, self, self.king_zone, color=color)
+            self.add(king)
 
             for i in range(num_agents):
                 position = self.get_valid_position(king_zone)
-                agent = Agent(world, position, self, color=color, mode='wander')
-                agent.apply_behavior_weights(self.cohesion_weight, self.separation_weight, self.alignment_weight, self.wander_weight)
-                self.agents.append(agent)
+                agent = agent_class(world, position, self, color=color, mode='wander')
+                self.add(agent)
         else:
             raise ValueError("King zone must be specified to spawn agents")
 
     def get_valid_position(self, zone):
         while True:
-            x = randint(zone[0], zone[0] + zone[2])
-            y = randint(zone[1], zone[1] + zone[3])
+            x = self.world.rng.spawn.randint(zone[0], zone[0] + zone[2])
+            y = self.world.rng.spawn.randint(zone[1], zone[1] + zone[3])
             position = Vector2D(x, y)
             if not self.is_position_in_wall(position):
                 return position
 
     def is_position_in_wall(self, position):
-        for wall in self.world.walls:
-            if wall.rect.collidepoint(position.x, position.y):
-                return True
-        return False
+        return self.world.wall_index.point_in_wall(position.x, position.y)
 
     def update(self, delta_time):
         if self.goal == 'attack':
             self.attack()
         elif self.goal == 'retreat':
             self.retreat()
-        for agent in self.agents[:]:  # Iterate over a copy of the list
-            if not agent.alive:
-                self.agents.remove(agent)
-            else:
-                agent.update(delta_time)
+        if self.engine is not None:
+            self.engine.update(delta_time)
+            return
+        profiler = self.world.profiler if self.world.profiler.enabled else None
+        grid = self.world.agent_grids[self]
+        self.jitter.refill(len(self.agents))
+        for agent in self.agents:  # Agents killed meanwhile stay in the list until remove_dead
+            if agent.alive:
+                agent.update(delta_time, profiler)
+                grid.move(agent, agent.position)
+        self.remove_dead()
+
+    def add(self, agent):
+        agent.slot = len(self.agents)  # Index in self.agents
+        self.agents.append(agent)
+
+    def remove_dead(self):
+        ''' Drop every agent killed since the last call. Each one is swapped with the last agent and
+        popped, so removal is O(1) per death, but agent order is not kept. '''
+        if not self.dead:
+            return
+        agents = self.agents
+        grid = self.world.agent_grids[self]
+        for agent in self.dead:
+            last = agents.pop()
+            if last is not agent:
+                agents[agent.slot] = last
+                last.slot = agent.slot
+            grid.remove(agent)
+            self.world.unregister_agent(agent)
+        self.dead.clear()
 
     def render(self, screen):
         for agent in self.agents:
@@ -66,7 +102,8 @@ class AgentGroup:
         self.cohesion_weight = cohesion_weight
         self.separation_weight = separation_weight
         self.alignment_weight = alignment_weight
-        self.wander_weight = wander_weight
+        self.wander_weight = wander_weight  # Agents read these straight from the group
 
-        for agent in self.agents:
-            agent.apply_behavior_weights(cohesion_weight, separation_weight, alignment_weight, wander_weight)
\ No newline at end of file
+    def set_max_speed(self, max_speed):
+        ''' Speed limit for every agent in the group, None goes back to each agent's own '''
+        self.max_speed = max_speed
\ No newline at end of file
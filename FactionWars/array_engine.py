@@ -0,0 +1,611 @@
+''' Optional NumPy structure-of-arrays engine for the flocking step.
+
+An AgentGroup built with engine='array' keeps its agents' positions, velocities,
+health, mode, etc. in contiguous arrays. The Agent objects stay around as thin
+views over their row so game logic and rendering work unchanged, but steering,
+integration and collisions run as vectorized passes over the whole group.
+'''
+import numpy as np
+from time import perf_counter
+from agent import Agent, KingAgent, WANDER_WEIGHT, MODES, MODE_CODES
+from vector2d import Vector2D
+
+WANDER = MODE_CODES['wander']
+CARRY_FOOD = MODE_CODES['carry_food']
+PATH_MODES = (MODE_CODES['follow_path'], MODE_CODES['start_attack'])  # Back to wander once the path runs out
+REBUCKET_ALL = 2  # update_spatial_hash rebuckets the whole group once more than 1 in this many rows changed cell
+
+
+class ArrayVector2D(Vector2D):
+    ''' Vector2D whose x and y live in a row of an (N, 2) array '''
+    __slots__ = ('_data', '_row')
+
+    def __init__(self, data, row):
+        self._data = data
+        self._row = row
+
+    @property
+    def x(self):
+        return float(self._data[self._row, 0])
+
+    @x.setter
+    def x(self, value):
+        self._data[self._row, 0] = value
+
+    @property
+    def y(self):
+        return float(self._data[self._row, 1])
+
+    @y.setter
+    def y(self, value):
+        self._data[self._row, 1] = value
+
+
+class ArrayBacked:
+    ''' Mixin that moves an agent's per-frame state into its group's ArrayFlockEngine '''
+
+    def __init__(self, world, position, group, *args, **kwargs):
+        self._engine = group.engine
+        self._engine.add(self)
+        self._carrying_food = None
+        super().__init__(world, position, group, *args, **kwargs)
+        self._engine.add_static(self)
+
+    def _set_vector(self, view, value):
+        if value is not view:
+            view._data[view._row] = (value.x, value.y)
+
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, value):
+        self._set_vector(self._position, value)
+
+    @property
+    def velocity(self):
+        return self._velocity
+
+    @velocity.setter
+    def velocity(self, value):
+        self._set_vector(self._velocity, value)
+
+    @property
+    def wander_target(self):
+        return self._wander_target
+
+    @wander_target.setter
+    def wander_target(self, value):
+        self._set_vector(self._wander_target, value)
+
+    @property
+    def health(self):
+        return int(self._engine.health[self._row])
+
+    @health.setter
+    def health(self, value):
+        self._engine.health[self._row] = value
+
+    @property
+    def alive(self):
+        return bool(self._engine.alive[self._row])
+
+    @alive.setter
+    def alive(self, value):
+        self._engine.alive[self._row] = value
+
+    @property
+    def mode(self):
+        return MODES[self._engine.mode[self._row]]
+
+    @mode.setter
+    def mode(self, value):
+        self._engine.mode[self._row] = MODE_CODES[value]
+
+    @property
+    def base_max_speed(self):
+        return float(self._engine.max_speed[self._row])
+
+    @base_max_speed.setter
+    def base_max_speed(self, value):
+        self._engine.max_speed[self._row] = value
+
+    @property
+    def enemy(self):
+        return Agent.enemy.fget(self)
+
+    @enemy.setter
+    def enemy(self, value):
+        Agent.enemy.fset(self, value)
+        self._engine.has_enemy[self._row] = value is not None
+
+    @property
+    def carrying_food(self):
+        return self._carrying_food
+
+    @carrying_food.setter
+    def carrying_food(self, value):
+        self._carrying_food = value
+        self._engine.carrying[self._row] = value is not None
+
+
+class ArrayAgent(ArrayBacked, Agent):
+    pass
+
+
+class ArrayKingAgent(ArrayBacked, KingAgent):
+    pass
+
+
+def lengths(v):
+    ''' Row-wise Vector2D.length. Spelled out per column, a sum over axis 1 of an (N, 2) array is far slower. '''
+    return np.sqrt(v[:, 0] * v[:, 0] + v[:, 1] * v[:, 1])
+
+
+def normalised(v):
+    ''' Row-wise unit vectors, zero rows stay zero (like Vector2D.normalise) '''
+    length = lengths(v)[:, None]
+    return np.divide(v, length, out=np.zeros_like(v), where=length > 0)
+
+
+def truncate(v, max_length):
+    ''' Row-wise Vector2D.truncate, max_length may be a scalar or per-row array '''
+    length = lengths(v)
+    over = length > max_length
+    if over.any():
+        limit = max_length[over] if np.ndim(max_length) else max_length
+        v[over] *= (limit / length[over])[:, None]
+    return v
+
+
+def transform_points(local, pos, forward, scale):
+    ''' World.transform_point for a whole group: row i of local goes from agent i's local space
+    (heading forward, side = forward.perp(), uniform scale) to world space '''
+    x = local[:, 0] * scale
+    y = local[:, 1] * scale
+    return np.stack([pos[:, 0] + x * forward[:, 0] - y * forward[:, 1],
+                     pos[:, 1] + x * forward[:, 1] + y * forward[:, 0]], axis=1)
+
+
+def radius_pairs(pos_a, pos_b, radius, exclude_self=False):
+    ''' All index pairs (i, j) with |pos_a[i] - pos_b[j]| <= radius.
+
+    pos_b is bucketed into cells of size radius and sorted by cell key, so each
+    point of pos_a only looks at the 3x3 block of cells around it. Returns
+    (i, j, offset, dist_sq) where offset = pos_a[i] - pos_b[j].
+    '''
+    empty = np.empty(0, dtype=np.intp)
+    if not len(pos_a) or not len(pos_b):
+        return empty, empty, np.empty((0, 2)), np.empty(0)
+
+    cell_a = np.floor(pos_a / radius).astype(np.int64)
+    cell_b = np.floor(pos_b / radius).astype(np.int64)
+    low = np.minimum(cell_a.min(axis=0), cell_b.min(axis=0)) - 1
+    cell_a -= low
+    cell_b -= low
+    rows = max(cell_a[:, 1].max(), cell_b[:, 1].max()) + 2  # Column stride, leaves room for cy +- 1
+
+    key_b = cell_b[:, 0] * rows + cell_b[:, 1]
+    order = np.argsort(key_b, kind='stable')
+    sorted_keys = key_b[order]
+    if pos_a is pos_b:
+        index_a, key_a = order, sorted_keys
+    else:
+        # Searching in key order is several times faster than with scattered keys
+        key_a = cell_a[:, 0] * rows + cell_a[:, 1]
+        index_a = np.argsort(key_a, kind='stable')
+        key_a = key_a[index_a]
+
+    all_i, all_j = [], []
+    for dx in (-1, 0, 1):
+        # Within a cell column the three cy-1..cy+1 keys are contiguous
+        key = key_a + dx * rows
+        start = np.searchsorted(sorted_keys, key - 1, 'left')
+        end = np.searchsorted(sorted_keys, key + 1, 'right')
+        counts = end - start
+        total = counts.sum()
+        if not total:
+            continue
+        first = np.cumsum(counts) - counts
+        offsets = np.arange(total) - np.repeat(first, counts)
+        all_i.append(np.repeat(index_a, counts))
+        all_j.append(order[np.repeat(start, counts) + offsets])
+
+    if not all_i:
+        return empty, empty, np.empty((0, 2)), np.empty(0)
+    i = np.concatenate(all_i)
+    j = np.concatenate(all_j)
+    # take() and index arrays rather than fancy or boolean indexing, several times faster at this size
+    offset = pos_a.take(i, axis=0) - pos_b.take(j, axis=0)
+    dist_sq = offset[:, 0] * offset[:, 0] + offset[:, 1] * offset[:, 1]
+    keep = dist_sq <= radius * radius
+    if exclude_self:
+        keep &= i != j
+    keep = np.flatnonzero(keep)
+    return i.take(keep), j.take(keep), offset.take(keep, axis=0), dist_sq.take(keep)
+
+
+class ArrayFlockEngine:
+    def __init__(self, group, capacity=16):
+        self.group = group
+        self.world = group.world
+        self.agents = []  # row -> agent, same order as group.agents
+        self.count = 0
+        self.rng = self.world.rng.numpy_generator('wander')
+        self.neighbor_radius = 15
+        self.wander_delta = 5.0  # Same delta Agent.calculate passes to wander
+        self.cells = np.empty((0, 2), dtype=np.int64)  # Spatial hash cell each row was last bucketed in
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        ''' (Re)allocate the arrays, keeping existing rows and re-pointing the agent views '''
+        old = getattr(self, 'pos', None)
+        n = self.count
+
+        def grow(name, shape, dtype, fill=0):
+            array = np.full(shape, fill, dtype=dtype)
+            if old is not None:
+                array[:n] = getattr(self, name)[:n]
+            setattr(self, name, array)
+
+        grow('pos', (capacity, 2), np.float64)
+        grow('vel', (capacity, 2), np.float64)
+        grow('wander_target', (capacity, 2), np.float64)
+        grow('health', capacity, np.int64)
+        grow('alive', capacity, np.bool_, True)
+        grow('mode', capacity, np.int8)
+        grow('max_speed', capacity, np.float64)
+        grow('has_enemy', capacity, np.bool_)
+        grow('carrying', capacity, np.bool_)
+        grow('is_king', capacity, np.bool_)
+        grow('radius', capacity, np.float64)
+        grow('mass', capacity, np.float64, 1)
+        grow('scale', capacity, np.float64, 1)
+        grow('max_force', capacity, np.float64)
+        grow('wander_distance', capacity, np.float64)
+        grow('wander_radius', capacity, np.float64)
+        grow('wander_jitter', capacity, np.float64)
+        self.capacity = capacity
+
+        for agent in self.agents:
+            agent._position._data = self.pos
+            agent._velocity._data = self.vel
+            agent._wander_target._data = self.wander_target
+
+    def add(self, agent):
+        if self.count == self.capacity:
+            self.allocate(self.capacity * 2)
+        row = self.count
+        self.count += 1
+        agent._row = row
+        agent._position = ArrayVector2D(self.pos, row)
+        agent._velocity = ArrayVector2D(self.vel, row)
+        agent._wander_target = ArrayVector2D(self.wander_target, row)
+        self.alive[row] = True
+        self.agents.append(agent)
+
+    def add_static(self, agent):
+        ''' Copy the per-agent constants that Agent.__init__ set up '''
+        row = agent._row
+        self.is_king[row] = isinstance(agent, KingAgent)
+        self.radius[row] = agent.radius
+        self.mass[row] = agent.mass
+        self.scale[row] = agent.scale.x
+        self.max_force[row] = agent.max_force
+        self.wander_distance[row] = agent.wander_distance
+        self.wander_radius[row] = agent.wander_radius
+        self.wander_jitter[row] = agent.wander_jitter
+
+    def remove_dead(self):
+        ''' AgentGroup.remove_dead for the arrays: the last live rows are moved into the holes that
+        dead rows leave below the new count, so only O(deaths) rows are copied '''
+        n = self.count
+        alive = self.alive[:n]
+        self.group.dead.clear()
+        if alive.all():
+            return
+        grid = self.world.agent_grids[self.group]
+        for row in np.flatnonzero(~alive):
+            agent = self.agents[row]
+            grid.remove(agent)
+            self.world.unregister_agent(agent)
+
+        m = int(alive.sum())
+        holes = np.flatnonzero(~alive[:m])
+        movers = np.flatnonzero(alive[m:]) + m
+        for name in ('pos', 'vel', 'wander_target', 'health', 'alive', 'mode', 'max_speed', 'has_enemy', 'carrying',
+                     'is_king', 'radius', 'mass', 'scale', 'max_force', 'wander_distance', 'wander_radius',
+                     'wander_jitter'):
+            array = getattr(self, name)
+            array[holes] = array[movers]
+        if len(self.cells) == n:
+            self.cells[holes] = self.cells[movers]
+            self.cells = self.cells[:m]
+        self.count = m
+
+        agents, group_agents = self.agents, self.group.agents
+        for row, old_row in zip(holes.tolist(), movers.tolist()):
+            agent = agents[old_row]
+            agents[row] = group_agents[row] = agent
+            agent._row = agent.slot = row
+            agent._position._row = row
+            agent._velocity._row = row
+            agent._wander_target._row = row
+        del agents[m:]
+        del group_agents[m:]
+
+    def speed_limits(self, n):
+        ''' Per-row max speed, the group's when it has one '''
+        max_speed = self.group.max_speed
+        return self.max_speed[:n] if max_speed is None else np.full(n, max_speed)
+
+    # Vectorized passes ----------------------------------------------------------------------------------------------------
+    def flocking_forces(self, n):
+        ''' Agent.calculate for every row: cohesion, separation, alignment and wander '''
+        group = self.group
+        pos = self.pos[:n]
+        vel = self.vel[:n]
+        max_speed = self.speed_limits(n)[:, None]
+
+        i, j, offset, dist_sq = radius_pairs(pos, pos, self.neighbor_radius, exclude_self=True)
+        count = np.bincount(i, minlength=n).astype(np.float64)
+        has = count > 0
+        safe_count = np.where(has, count, 1)[:, None]
+
+        # Cohesion
+        center = np.stack([np.bincount(i, pos[:, 0].take(j), n), np.bincount(i, pos[:, 1].take(j), n)], axis=1) / safe_count
+        cohesion = normalised(center - pos) * max_speed - vel
+        cohesion[~has] = 0
+
+        # Separation, direction.normalise() * (1 / distance) == offset / distance^2
+        moving = np.flatnonzero(dist_sq > 0)
+        push = offset.take(moving, axis=0) / dist_sq.take(moving)[:, None]
+        i_moving = i.take(moving)
+        separation = np.stack([np.bincount(i_moving, push[:, 0], n), np.bincount(i_moving, push[:, 1], n)], axis=1)
+
+        # Alignment
+        heading = normalised(vel)
+        average = np.stack([np.bincount(i, heading[:, 0].take(j), n), np.bincount(i, heading[:, 1].take(j), n)],
+                           axis=1) / safe_count
+        alignment = average - heading
+        alignment[~has] = 0
+
+        # Wander, only wandering agents move their wander target
+        wandering = self.mode[:n] == WANDER
+        wt = self.wander_target[:n]
+        jitter = self.rng.uniform(-1, 1, (n, 2)) * (self.wander_jitter[:n] * self.wander_delta)[:, None]
+        wt[wandering] = normalised(wt[wandering] + jitter[wandering]) * self.wander_radius[:n][wandering, None]
+        local = wt.copy()
+        local[:, 0] += self.wander_distance[:n]
+        world_target = transform_points(local, pos, heading, self.scale[:n])
+        wander = normalised(world_target - pos) * max_speed - vel
+
+        steering = (cohesion * group.cohesion_weight + separation * group.separation_weight
+                    + alignment * group.alignment_weight + wander * WANDER_WEIGHT)
+        return truncate(steering, self.max_force[:n]), count
+
+    def enemies_nearby(self, n):
+        ''' Rows with an enemy inside their detect_enemy radius '''
+        other = self.world.get_other_group(self.group)
+        if other is None:
+            return np.zeros(n, dtype=np.bool_)
+        if other.engine is not None:
+            other_pos = other.engine.pos[:other.engine.count]
+        else:
+            other_pos = np.array([(a.position.x, a.position.y) for a in other.agents], dtype=np.float64).reshape(-1, 2)
+        detection = 8 * self.scale[:n]
+        i, _, _, dist_sq = radius_pairs(self.pos[:n], other_pos, detection.max() if n else 0)
+        near = np.zeros(n, dtype=np.bool_)
+        near[i[dist_sq < detection[i] ** 2]] = True
+        return near
+
+    def in_king_zone(self, n):
+        ''' Vectorized Agent.is_in_king_zone '''
+        x, y, width, height = self.group.king_zone
+        margin = 50
+        pos = self.pos[:n]
+        return ((x + margin <= pos[:, 0]) & (pos[:, 0] <= x + width - margin)
+                & (y + margin <= pos[:, 1]) & (pos[:, 1] <= y + height - margin))
+
+    def follow_paths(self, rows, forces, n):
+        ''' Agent.state_machine for the rows in rows that are walking a path they already have: seek
+        the next waypoint, popping it once it is within the agent's radius. Returns the rows left
+        for the agents' own state machines (no path yet, fighting, carrying food into the zone). '''
+        mode = self.mode[rows]
+        walking = (mode == CARRY_FOOD) & ~self.in_king_zone(n)[rows]
+        for code in PATH_MODES:
+            walking |= mode == code
+        agents = self.agents
+        ready = [row for row in rows[walking].tolist() if agents[row].path]
+        if not ready:
+            return rows
+        x, y, width, height = self.group.king_zone
+        waypoints = np.empty((len(ready), 2))
+        for k, row in enumerate(ready):
+            agent = agents[row]
+            if agent.mode == 'carry_food':
+                if agent.target is None:
+                    agent.target = Vector2D()
+                agent.target.set(x + width / 2, y + height / 2)
+            waypoint = agent.path[0]
+            waypoints[k] = waypoint.x, waypoint.y
+        ready = np.array(ready)
+        pos = self.pos[ready]
+
+        offset = waypoints - pos
+        arrived = np.zeros(len(ready), dtype=np.bool_)
+        for k in np.flatnonzero(lengths(offset) < self.radius[ready]):
+            path = agents[ready[k]].path
+            path.pop(0)
+            if path:
+                waypoints[k] = path[0].x, path[0].y
+            else:
+                arrived[k] = True  # Path is completed
+        force = normalised(waypoints - pos) * self.speed_limits(n)[ready, None] - self.vel[ready]
+        force[arrived] = 0
+        forces[ready] = force
+
+        stopped = np.isin(self.mode[ready], PATH_MODES) & ~force.any(axis=1)
+        for row in ready[stopped]:
+            agent = agents[row]
+            agent.mode = 'wander'
+            agent.target = None
+        return np.setdiff1d(rows, ready, assume_unique=True)
+
+    def check_bounds(self, n):
+        pos = self.pos[:n]
+        vel = self.vel[:n]
+        radius = self.radius[:n]
+        normal = ~self.is_king[:n]
+        for axis, limit in ((0, self.world.width), (1, self.world.height)):
+            low = normal & (pos[:, axis] - radius < 0)
+            high = normal & ~low & (pos[:, axis] + radius > limit)
+            pos[low, axis] = radius[low]
+            pos[high, axis] = limit - radius[high]
+            vel[low | high, axis] *= -1
+        for row in np.flatnonzero(self.is_king[:n]):
+            self.agents[row].check_bounds()
+
+    def wall_lookup(self):
+        ''' World.wall_index flattened into arrays: per-cell offsets into a list of wall numbers '''
+        if getattr(self, '_wall_lookup', None) is None:
+            world = self.world
+            index = world.wall_index
+            columns, rows = world.grid_width + 1, world.grid_height + 1  # Room for the far edge
+            numbers = {id(wall): k for k, wall in enumerate(world.walls)}
+            rects = np.array([(w.rect.left, w.rect.top, w.rect.right, w.rect.bottom) for w in world.walls],
+                             dtype=np.float64).reshape(-1, 4)
+            counts = np.zeros(columns * rows, dtype=np.int64)
+            cell_walls = [[] for _ in range(columns * rows)]
+            for (cx, cy), walls in index.cells.items():
+                if 0 <= cx < columns and 0 <= cy < rows:
+                    cell_walls[cx * rows + cy] = [numbers[id(wall)] for wall in walls]
+                    counts[cx * rows + cy] = len(walls)
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            flat = np.array([k for walls in cell_walls for k in walls], dtype=np.int64)
+            self._wall_lookup = (rows, columns, index.cell_size, offsets, flat, rects)
+        return self._wall_lookup
+
+    def check_wall_collision(self, n):
+        ''' Agent.check_wall_collision over World.wall_index. Round k tests every agent against the
+        k-th wall listed in its cell, so each agent still meets its walls in order. '''
+        rows_per_column, columns, cell_size, offsets, flat, rects = self.wall_lookup()
+        if not len(flat):
+            return
+        pos = self.pos[:n]
+        vel = self.vel[:n]
+        radius = self.radius[:n]
+        cx = np.clip(np.floor(pos[:, 0] / cell_size).astype(np.int64), 0, columns - 1)
+        cy = np.clip(np.floor(pos[:, 1] / cell_size).astype(np.int64), 0, rows_per_column - 1)
+        key = cx * rows_per_column + cy
+        first = offsets[key]
+        count = offsets[key + 1] - first
+        candidates = np.flatnonzero(count)
+        for k in range(int(count.max()) if len(candidates) else 0):
+            rows = candidates[count[candidates] > k]
+            left, top, right, bottom = rects[flat[first[rows] + k]].T
+            x = pos[rows, 0]
+            y = pos[rows, 1]
+            r = radius[rows]
+            dx = x - np.clip(x, left, right)
+            dy = y - np.clip(y, top, bottom)
+            inside = dx * dx + dy * dy < r * r
+            if not inside.any():
+                continue
+            rows, x, y, r = rows[inside], x[inside], y[inside], r[inside]
+            left, top, right, bottom = left[inside], top[inside], right[inside], bottom[inside]
+            before, after = x < left, x > right
+            pos[rows[before], 0] = (left - r)[before]
+            pos[rows[after], 0] = (right + r)[after]
+            vel[rows[before | after], 0] *= -1
+            before, after = y < top, y > bottom
+            pos[rows[before], 1] = (top - r)[before]
+            pos[rows[after], 1] = (bottom + r)[after]
+            vel[rows[before | after], 1] *= -1
+
+    def check_food_collision(self, n):
+        ''' Agent.check_food_collision for every agent that is not carrying anything '''
+        group = self.group
+        food = [f for f in self.world.food if f.being_held_by is None and group not in f.zone_groups]
+        if not food:
+            return
+        free = np.flatnonzero(~self.carrying[:n])
+        if not len(free):
+            return
+        food_pos = np.array([(f.position.x, f.position.y) for f in food], dtype=np.float64)
+        food_radius = np.array([f.radius for f in food], dtype=np.float64)
+        radius = self.radius[free]
+        i, j, _, dist_sq = radius_pairs(self.pos[free], food_pos, radius.max() + food_radius.max())
+        touching = dist_sq < (radius[i] + food_radius[j]) ** 2
+        for row in np.unique(free[i[touching]]):
+            # Rare, so finish off with the agent's own logic in list order
+            self.agents[row].check_food_collision()
+
+    def update_spatial_hash(self, n):
+        grid = self.world.agent_grids[self.group]
+        cells = np.floor(self.pos[:n] / grid.cell_size).astype(np.int64)
+        if len(self.cells) == n:
+            moved = np.flatnonzero((cells[:, 0] != self.cells[:, 0]) | (cells[:, 1] != self.cells[:, 1]))
+        else:
+            moved = range(n)
+        agents = self.agents
+        if len(moved) * REBUCKET_ALL > n:
+            # Cheaper to bucket everything again in one pass than to move this many one by one
+            grid.rebuild_cells(agents[:n], list(zip(*cells.T.tolist())))
+        else:
+            grid.move_cells([agents[row] for row in moved.tolist()], list(zip(*cells.take(moved, axis=0).T.tolist())))
+        self.cells = cells
+
+    def update(self, delta_time):
+        ''' Vectorized AgentGroup.update: steering, truncation, integration and collisions '''
+        self.remove_dead()
+        n = self.count
+        if not n:
+            return
+        profiler = self.world.profiler if self.world.profiler.enabled else None
+        if profiler is not None:
+            mark = perf_counter()
+
+        forces, count = self.flocking_forces(n)  # Neighbour search and flocking in one pass
+        if profiler is not None:
+            mark = profiler.lap('neighbors', mark)
+
+        # Per-agent state machine, only for agents that are not plainly wandering
+        wandering = self.mode[:n] == WANDER
+        candidates = wandering & (count > 1) & ~self.in_king_zone(n)
+        if candidates.any():
+            candidates &= self.has_enemy[:n] | self.enemies_nearby(n)
+        agents = self.agents
+        for row in np.flatnonzero(candidates):
+            agent = agents[row]
+            agent.neighbors = agent.get_neighbors(self.neighbor_radius)
+            agent.look_for_enemies()
+        rows = np.flatnonzero(~wandering)
+        if len(rows):
+            self.group.jitter.refill(n)  # In case a state machine falls back to Agent.wander
+            rows = self.follow_paths(rows, forces, n)
+        for row in rows:
+            agent = agents[row]
+            force = agent.state_machine()
+            forces[row] = (force.x, force.y) if force is not None else (0, 0)
+            if agent.mode == 'wander':
+                agent.target = None
+        if profiler is not None:
+            mark = profiler.lap('state_machine', mark)
+
+        # Integration
+        truncate(forces, self.max_force[:n])
+        vel = self.vel[:n]
+        vel += forces / self.mass[:n, None] * delta_time
+        truncate(vel, self.speed_limits(n))
+        self.pos[:n] += vel * delta_time
+        if profiler is not None:
+            mark = profiler.lap('integration', mark)
+
+        self.check_bounds(n)
+        self.check_wall_collision(n)
+        self.check_food_collision(n)
+        self.update_spatial_hash(n)
+        if profiler is not None:
+            profiler.lap('collisions', mark)
@@ -40,14 +40,20 @@ class PriorityQueue:
     def __contains__(self, item):
         return any(item == pair[1] for pair in self.heap)
 
-def a_star_search(initial, goal, get_neighbors, step_cost, heuristic):
+def a_star_search(initial, goal, get_neighbors, step_cost, heuristic, grid=None, diagonal=False):
     '''
     Perform A* search with an explored set. This implementation uses a PriorityQueue as the frontier, 
     which stores tuples of (f(n), node) where f(n) = g(n) + h(n). 
     g(n) is the path cost and h(n) is the heuristic estimate (Manhattan Distance) of the cost from n to the goal state. 
     Returns a tuple containing the goal node and the number of nodes expanded during the search. 
     Returns None if no goal state is found.
+
+    Passing a GridMap as grid switches to the flat array grid search (get_neighbors, step_cost and
+    heuristic are then ignored), diagonal=True allows octile 8-connected moves in that mode.
     '''
+    if grid is not None:
+        return grid.search(initial, goal, diagonal)
+
     node = Node(initial)
     num_of_nodes = 1  # Count the initial node
     if node.state == goal:
@@ -73,3 +79,192 @@ def a_star_search(initial, goal, get_neighbors, step_cost, heuristic):
                     frontier.append((child_f_n, child))
 
     return None, num_of_nodes # Remove num_of_nodes after testing paths
+
+
+class GridPath:
+    ''' Result of a GridMap search, quacks like the goal Node (state, path_cost, path()) '''
+    def __init__(self, cells, path_cost):
+        self.cells = cells
+        self.state = cells[-1]
+        self.path_cost = path_cost
+
+    def path(self):
+        return list(self.cells)
+
+
+class GridMap:
+    ''' Flat array A* over a World.grid style occupancy grid (grid[x][y] == 0 means free).
+
+    Cells are integer indices x * height + y. The g-score, parent and closed arrays are allocated
+    once and invalidated between searches with a search stamp rather than cleared. Optimal paths
+    found for a goal are remembered, so a later query starting anywhere on one of them reuses
+    its tail instead of searching again.
+    '''
+    SQRT2 = 2 ** 0.5
+
+    def __init__(self, grid, reuse_goals=16):
+        self.reuse_goals = reuse_goals
+        self.update(grid)
+
+    def update(self, grid):
+        ''' (Re)load the occupancy grid, call again whenever walls change '''
+        self.width = len(grid)
+        self.height = len(grid[0]) if grid else 0
+        size = self.width * self.height
+        self.blocked = bytearray(size)
+        for x, column in enumerate(grid):
+            for y, value in enumerate(column):
+                if value != 0:
+                    self.blocked[x * self.height + y] = 1
+        self.g_score = [0.0] * size
+        self.parent = [-1] * size
+        self.seen = [0] * size  # g_score/parent valid when == stamp
+        self.closed = [0] * size  # Expanded when == stamp
+        self.stamp = 0
+        self.reused = {}  # goal -> {cell: (cells, index)}, least recently used goal first
+
+    def in_bounds(self, cell):
+        return 0 <= cell[0] < self.width and 0 <= cell[1] < self.height
+
+    def search(self, initial, goal, diagonal=False):
+        ''' Returns (GridPath or None, num_of_nodes) like a_star_search '''
+        if initial == goal:
+            return GridPath([initial], 0), 1
+        if not self.in_bounds(goal) or self.blocked[goal[0] * self.height + goal[1]]:
+            return None, 1  # Moves only go into free cells, so the goal can never be entered
+
+        known = self.reused.get((goal, diagonal))
+        if known is not None and initial in known:
+            cells, index = known[initial]
+            self.reused[(goal, diagonal)] = self.reused.pop((goal, diagonal))  # Mark recently used
+            tail = cells[index:]
+            return GridPath(tail, self.path_cost(tail)), 1
+
+        result, num_of_nodes = self._search(initial, goal, diagonal)
+        if result is not None:
+            self.remember(result.cells, goal, diagonal)
+        return result, num_of_nodes
+
+    def path_cost(self, cells):
+        cost = 0.0
+        for (x1, y1), (x2, y2) in zip(cells, cells[1:]):
+            cost += self.SQRT2 if x1 != x2 and y1 != y2 else 1
+        return cost
+
+    def remember(self, cells, goal, diagonal):
+        known = self.reused.pop((goal, diagonal), None)
+        if known is None:
+            known = {}
+            if len(self.reused) >= self.reuse_goals:
+                del self.reused[next(iter(self.reused))]
+        for index, cell in enumerate(cells):
+            if cell not in known:
+                known[cell] = (cells, index)
+        self.reused[(goal, diagonal)] = known
+
+    def _search(self, initial, goal, diagonal):
+        width, height = self.width, self.height
+        blocked, g_score, parent, seen, closed = self.blocked, self.g_score, self.parent, self.seen, self.closed
+        self.stamp += 1
+        stamp = self.stamp
+        gx, gy = goal
+        goal_index = gx * height + gy
+        sqrt2 = self.SQRT2
+        diagonal_extra = sqrt2 - 2
+
+        def heuristic(index):
+            dx = abs(index // height - gx)
+            dy = abs(index % height - gy)
+            if diagonal:
+                return dx + dy + diagonal_extra * (dx if dx < dy else dy)
+            return dx + dy
+
+        frontier = []
+        push, pop = heapq.heappush, heapq.heappop
+        num_of_nodes = 1
+
+        if self.in_bounds(initial):
+            start_index = initial[0] * height + initial[1]
+            seen[start_index] = stamp
+            g_score[start_index] = 0.0
+            parent[start_index] = -1
+            h = heuristic(start_index)
+            push(frontier, (h, h, start_index))
+        else:
+            # Off grid start (eg. the strip past the last full column), step straight onto its free neighbours
+            start_index = -1
+            num_of_nodes += 1
+            x, y = initial
+            for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                if 0 <= nx < width and 0 <= ny < height and not blocked[nx * height + ny]:
+                    index = nx * height + ny
+                    seen[index] = stamp
+                    g_score[index] = 1.0
+                    parent[index] = -1
+                    h = heuristic(index)
+                    push(frontier, (1.0 + h, h, index))
+
+        while frontier:
+            f, h, index = pop(frontier)
+            if closed[index] == stamp:
+                continue
+            closed[index] = stamp
+            num_of_nodes += 1
+            if index == goal_index:
+                break
+
+            g = g_score[index]
+            x, y = divmod(index, height)
+            # Left, right, up, down, same order as World.get_neighbors
+            moves = []
+            if x > 0:
+                moves.append(index - height)
+            if x < width - 1:
+                moves.append(index + height)
+            if y > 0:
+                moves.append(index - 1)
+            if y < height - 1:
+                moves.append(index + 1)
+            for child in moves:
+                if blocked[child] or closed[child] == stamp:
+                    continue
+                child_g = g + 1
+                if seen[child] == stamp and child_g >= g_score[child]:
+                    continue  # Dominated, don't queue
+                seen[child] = stamp
+                g_score[child] = child_g
+                parent[child] = index
+                child_h = heuristic(child)
+                push(frontier, (child_g + child_h, child_h, child))
+
+            if diagonal:
+                for dx, dy in ((-1, -1), (1, -1), (-1, 1), (1, 1)):
+                    nx, ny = x + dx, y + dy
+                    if not (0 <= nx < width and 0 <= ny < height):
+                        continue
+                    child = nx * height + ny
+                    # No corner cutting, both orthogonal cells must be free
+                    if blocked[child] or blocked[nx * height + y] or blocked[x * height + ny] or closed[child] == stamp:
+                        continue
+                    child_g = g + sqrt2
+                    if seen[child] == stamp and child_g >= g_score[child]:
+                        continue
+                    seen[child] = stamp
+                    g_score[child] = child_g
+                    parent[child] = index
+                    child_h = heuristic(child)
+                    push(frontier, (child_g + child_h, child_h, child))
+        else:
+            return None, num_of_nodes
+
+        cells = []
+        index = goal_index
+        while index != -1:
+            cells.append(divmod(index, height))
+            if index == start_index:
+                break
+            index = parent[index]
+        if start_index == -1:
+            cells.append(initial)
+        cells.reverse()
+        return GridPath(cells, g_score[goal_index]), num_of_nodes
@@ -0,0 +1 @@
+''' Benchmarks for the simulation hot paths. Run from the FactionWars directory, eg. python -m benchmarks.run '''
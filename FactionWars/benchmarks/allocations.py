@@ -0,0 +1,148 @@
+''' Count Vector2D and Matrix33 objects allocated per tick by the flocking pass.
+
+"before" runs a copy of the original operator based Agent.calculate (a + b, v * s,
+get_normalised(), a Matrix33 for the wander transform, ...), "after" runs the current
+scratch vector version on the same agents, and "tick" counts a whole World.update.
+'''
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import contextlib
+import json
+from matrix33 import Matrix33
+from vector2d import Vector2D
+from world import World
+
+
+def legacy_transform_points(points, pos, forward, side, scale):
+    ''' World.transform_points as it was before the closed form, one Matrix33 per call '''
+    world_points = [point.copy() for point in points]
+    matrix = Matrix33()
+    matrix.scale_update(scale.x, scale.y)
+    matrix.rotate_by_vectors_update(forward, side)
+    matrix.translate_update(pos.x, pos.y)
+    matrix.transform_vector2d_list(world_points)
+    return world_points
+
+
+def legacy_calculate(agent, neighbors):
+    ''' Agent.calculate as it was before the in-place Vector2D API '''
+    def cohesion():
+        if not neighbors:
+            return Vector2D()
+        sum_pos = Vector2D()
+        for other in neighbors:
+            sum_pos += other.position
+        center_of_mass = sum_pos / len(neighbors)
+        return (center_of_mass - agent.position).normalise() * agent.max_speed - agent.velocity
+
+    def separation():
+        if not neighbors:
+            return Vector2D()
+        force = Vector2D()
+        for other in neighbors:
+            direction = agent.position - other.position
+            distance = direction.length()
+            if distance > 0:
+                force += direction.normalise() * (1.0 / distance)
+        return force
+
+    def alignment():
+        if not neighbors:
+            return Vector2D()
+        sum_heading = Vector2D()
+        for other in neighbors:
+            sum_heading += other.velocity.get_normalised()
+        return sum_heading / len(neighbors) - agent.velocity.get_normalised()
+
+    def wander(delta):
+        wt = agent.wander_target
+        jitter_tts = agent.wander_jitter * delta
+        jitter = agent.group.jitter.values  # Originally two uniform(-1, 1) calls, same numbers as the current version
+        wt += Vector2D(jitter[2 * agent.slot] * jitter_tts, jitter[2 * agent.slot + 1] * jitter_tts)
+        wt.normalise()
+        wt *= agent.wander_radius
+        target = wt + Vector2D(agent.wander_distance, 0)
+        wld_target = legacy_transform_points([target], agent.position, agent.velocity.get_normalised(),
+                                             agent.velocity.get_normalised().perp(), agent.scale)
+        return (wld_target[0] - agent.position).normalise() * agent.max_speed - agent.velocity
+
+    steering_force = (cohesion() * agent.cohesion_weight + separation() * agent.separation_weight
+                      + alignment() * agent.alignment_weight + wander(5.0) * 0.8)
+    steering_force.truncate(agent.max_force)
+    return steering_force
+
+
+@contextlib.contextmanager
+def counting():
+    ''' Count Vector2D and Matrix33 constructions inside the block '''
+    counts = {'Vector2D': 0, 'Matrix33': 0}
+    vector_init, matrix_init = Vector2D.__init__, Matrix33.__init__
+
+    def count_vector(self, x=0., y=0.):
+        counts['Vector2D'] += 1
+        vector_init(self, x, y)
+
+    def count_matrix(self, m=None):
+        counts['Matrix33'] += 1
+        matrix_init(self, m)
+
+    Vector2D.__init__, Matrix33.__init__ = count_vector, count_matrix
+    try:
+        yield counts
+    finally:
+        Vector2D.__init__, Matrix33.__init__ = vector_init, matrix_init
+
+
+def flocking_pass(agents, calculate):
+    forces = []
+    for agent in agents:
+        force = calculate(agent, agent.get_neighbors(15))
+        forces.append((force.x, force.y))
+    return forces
+
+
+def run(num_agents=200, warmup=20, seed=0):
+    world = World(1000, 800, num_agents=num_agents, seed=seed)
+    for _ in range(warmup):
+        world.update(0.2)
+    agents = world.get_all_agents()
+
+    # Same random draws for both versions, and wander targets reset in between
+    targets = [agent.wander_target.copy() for agent in agents]
+    for group in (world.group1, world.group2):
+        group.jitter.refill(len(group.agents))
+    with counting() as before:
+        legacy_forces = flocking_pass(agents, legacy_calculate)
+
+    for agent, target in zip(agents, targets):
+        agent.wander_target.set_from(target)
+    with counting() as after:
+        forces = flocking_pass(agents, lambda agent, neighbors: agent.calculate(neighbors))
+    for (x1, y1), (x2, y2) in zip(legacy_forces, forces):
+        assert abs(x1 - x2) < 1e-9 and abs(y1 - y2) < 1e-9, 'Steering forces differ from the original'
+
+    with counting() as tick:
+        world.update(0.2)
+
+    per_agent = lambda counts: {name: count / len(agents) for name, count in counts.items()}
+    return {
+        'agents': len(agents),
+        'before': {'flocking_pass': dict(before), 'per_agent': per_agent(before)},
+        'after': {'flocking_pass': dict(after), 'per_agent': per_agent(after)},
+        'tick': dict(tick),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--agents', type=int, default=200, help='Agents per group')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.agents, args.warmup, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+''' Compare the Node based a_star_search with the flat array GridMap search on World.grid layouts '''
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import json
+import random
+import time
+from astar import a_star_search, GridMap
+from world import World
+
+
+def free_cells(world):
+    return [(x, y) for x in range(world.grid_width) for y in range(world.grid_height) if world.grid[x][y] == 0]
+
+
+def time_queries(search, queries):
+    nodes = 0
+    found = 0
+    start = time.perf_counter()
+    for initial, goal in queries:
+        result, num_of_nodes = search(initial, goal)
+        nodes += num_of_nodes
+        found += result is not None
+    elapsed = time.perf_counter() - start
+    return {
+        'ms_per_query': 1000 * elapsed / len(queries),
+        'nodes_per_query': nodes / len(queries),
+        'found': found,
+    }
+
+
+def run(layouts=5, queries=200, seed=0):
+    results = []
+    for layout in range(layouts):
+        world = World(1000, 800, num_agents=0, seed=seed + layout)
+        rng = random.Random(seed + layout)
+        cells = free_cells(world)
+        pairs = [(rng.choice(cells), rng.choice(cells)) for _ in range(queries)]
+        # Many agents heading for a handful of targets, which is where path reuse kicks in
+        goals = rng.sample(cells, 4)
+        shared = [(rng.choice(cells), rng.choice(goals)) for _ in range(queries)]
+
+        node_search = lambda i, g: a_star_search(i, g, world.get_neighbors, world.step_cost, world.heuristic)
+        grid4 = GridMap(world.grid)
+        grid8 = GridMap(world.grid)
+        grid_shared = GridMap(world.grid)
+        results.append({
+            'layout': layout,
+            'seed': seed + layout,
+            'node': time_queries(node_search, pairs),
+            'grid4': time_queries(lambda i, g: grid4.search(i, g), pairs),
+            'grid8': time_queries(lambda i, g: grid8.search(i, g, diagonal=True), pairs),
+            'node_shared_goals': time_queries(node_search, shared),
+            'grid4_shared_goals': time_queries(lambda i, g: grid_shared.search(i, g), shared),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--layouts', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.layouts, args.queries, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+''' Per-tick cost of the simulation hot paths at several agent counts, as JSON.
+
+For each scale a seeded World is built with the map grown to keep the default game's agent
+density, and the agents are scattered over free ground (not packed into the king zones).
+Each per-agent operation is then timed over every agent once, ie. what one tick spends on it,
+taking the best of --repeat runs. plan_path and a_star_search are timed over --queries random
+requests, cold (flow fields and path caches dropped before every run) and _warm (the same
+requests again with the caches they left behind). update is one whole World.update and render one World.render to an offscreen surface.
+
+The per-agent operations always time the Python Agent methods. With --engine array, update
+shows what the engine does with them.
+'''
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import json
+import math
+import random
+import time
+import pygame
+from astar import a_star_search, GridMap
+from food import Food
+from headless import DEFAULT_DELTA_TIME
+from world import World
+
+OPERATIONS = ('get_neighbors', 'detect_enemy', 'calculate', 'check_wall_collision', 'check_food_collision',
+              'plan_path', 'plan_path_warm', 'a_star_search', 'a_star_search_warm', 'update', 'render')
+PATH_OPERATIONS = ('plan_path', 'plan_path_warm', 'a_star_search', 'a_star_search_warm')  # Timed per query
+BASE_AGENTS = 200  # Per group, on the default 1000 x 800 map with 30 food
+
+
+def build_world(agents, seed, engine=None):
+    factor = math.sqrt(agents / BASE_AGENTS)
+    width, height = int(1000 * factor), int(800 * factor)
+    world = World(width, height, engine=engine, num_agents=agents, seed=seed)
+    rng = world.rng.stream('benchmark')
+    # Same food density as the default map
+    world.food.extend(Food(world) for _ in range(int(world.num_food * factor * factor) - len(world.food)))
+    world.max_food_radius = max(food.radius for food in world.food)
+    for group in (world.group1, world.group2):
+        for agent in group.agents[1:]:  # The king stays in its zone
+            while True:
+                x, y = rng.uniform(0, width), rng.uniform(0, height)
+                if not world.wall_index.point_in_wall(x, y):
+                    break
+            agent.position.set(x, y)
+        world.agent_grids[group].rebuild(group.agents)
+    return world
+
+
+def best_of(repeat, run, reset=None):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+        if reset is not None:
+            reset()
+    return best
+
+
+def drop_all_food(world):
+    for agent in world.get_all_agents():
+        if agent.carrying_food is not None:
+            agent.drop_food()
+            agent.mode = 'wander'
+
+
+def time_operations(world, repeat, queries, seed, render_limit):
+    agents = world.get_all_agents()
+    rng = random.Random(seed)
+    timings = {}
+
+    timings['get_neighbors'] = best_of(repeat, lambda: [agent.get_neighbors(15) for agent in agents])
+    timings['detect_enemy'] = best_of(repeat, lambda: [agent.detect_enemy() for agent in agents])
+    neighbors = [agent.get_neighbors(15) for agent in agents]
+    timings['calculate'] = best_of(repeat, lambda: [agent.calculate(n) for agent, n in zip(agents, neighbors)])
+    timings['check_wall_collision'] = best_of(repeat, lambda: [agent.check_wall_collision() for agent in agents])
+    timings['check_food_collision'] = best_of(repeat, lambda: [agent.check_food_collision() for agent in agents],
+                                              lambda: drop_all_food(world))
+
+    free = [(x, y) for x in range(world.grid_width) for y in range(world.grid_height) if world.grid[x][y] == 0]
+    requests = [(world.grid_to_world(rng.choice(free)), world.grid_to_world(rng.choice(free))) for _ in range(queries)]
+    plan = lambda: [world.plan_path(start, goal) for start, goal in requests]
+    timings['plan_path'] = best_of(repeat, plan, world.grid_changed)  # grid_changed drops every path cache
+    timings['plan_path_warm'] = best_of(repeat, plan)
+    world.grid_changed()
+
+    grids = [GridMap(world.grid)]  # Replaced between cold runs, GridMap remembers the paths it found
+    cells = [(world.world_to_grid(start), world.world_to_grid(goal)) for start, goal in requests]
+    search = lambda: [a_star_search(start, goal, world.get_neighbors, world.step_cost, world.heuristic, grid=grids[0])
+                      for start, goal in cells]
+    timings['a_star_search'] = best_of(repeat, search, lambda: grids.__setitem__(0, GridMap(world.grid)))
+    timings['a_star_search_warm'] = best_of(repeat, search)
+
+    timings['update'] = best_of(repeat, lambda: world.update(DEFAULT_DELTA_TIME))
+
+    if world.width * world.height <= render_limit:
+        surface = pygame.Surface((world.width, world.height))
+        world.render(surface)  # Builds the cached background and sprites
+        timings['render'] = best_of(repeat, lambda: world.render(surface))
+    else:
+        timings['render'] = None
+
+    results = {}
+    for name, seconds in timings.items():
+        if seconds is None:
+            results[name] = None
+            continue
+        if name in PATH_OPERATIONS:  # Not a per-tick cost, see us_per_call
+            results[name] = {'ms_per_tick': None, 'us_per_call': 1e6 * seconds / queries}
+        else:
+            results[name] = {'ms_per_tick': 1000 * seconds, 'us_per_call': 1e6 * seconds / len(agents)}
+    return results
+
+
+def run(scales=(200, 2000, 20000), seed=0, engine=None, repeat=3, queries=50, render_limit=16_000_000):
+    pygame.init()
+    results = []
+    for agents in scales:
+        start = time.perf_counter()
+        world = build_world(agents, seed, engine)
+        build_seconds = time.perf_counter() - start
+        results.append({
+            'agents_per_group': agents,
+            'world': [world.width, world.height],
+            'food': len(world.food),
+            'path_mode': world.path_mode,
+            'build_s': build_seconds,
+            'operations': time_operations(world, repeat, queries, seed, render_limit),
+        })
+    return {'seed': seed, 'engine': engine, 'repeat': repeat, 'scales': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--agents', type=int, nargs='+', default=[200, 2000, 20000], help='Agents per group')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engine', choices=['array'], default=None)
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per operation, the best one is reported')
+    parser.add_argument('--queries', type=int, default=50, help='Path requests timed per scale')
+    parser.add_argument('--render-limit', type=int, default=16_000_000,
+                        help='Skip render on maps with more pixels than this')
+    parser.add_argument('--out', default=None, help='Write the JSON here as well as printing it')
+    args = parser.parse_args()
+    results = run(args.agents, args.seed, args.engine, args.repeat, args.queries, args.render_limit)
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as out:
+            out.write(text + '\n')
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
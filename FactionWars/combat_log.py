@@ -0,0 +1,92 @@
+''' Combat events (hits, kills, ally notifications) kept in a ring buffer on World.
+
+Callers test the level before building an event, so with the log OFF (the default) a hit
+costs one attribute compare. Recorded events stay in the last capacity slots of the buffer
+for inspection and, once a file is opened, are also written out in batches: every
+flush_every ticks on the simulation thread, or handed to a writer thread with async_writes.
+'''
+import csv
+import queue
+import threading
+from collections import deque
+
+# Levels, each one records everything the ones below it do
+OFF = 0
+KILLS = 1
+HITS = 2
+ALL = 3  # Also attacks out of range and ally notifications
+
+FIELDS = ('tick', 'event', 'attacker', 'target', 'damage', 'health')
+
+
+class CombatLog:
+    def __init__(self, world, level=OFF, capacity=10000):
+        self.world = world
+        self.level = level
+        self.events = deque(maxlen=capacity)  # (tick, event, attacker id, target id, damage, target health)
+        self.counts = {}  # event -> number recorded, including those pushed out of the buffer
+        self.unwritten = []  # Recorded since the last flush, only kept while a file is open
+        self.file = None
+        self.writer = None
+        self.flush_every = 60
+        self.thread = None
+        self.batches = None
+
+    def record(self, event, attacker, target, damage=0):
+        ''' attacker and target are agents, stored by id '''
+        entry = (self.world.tick, event, attacker.id, target.id, damage, target.health)
+        self.events.append(entry)
+        self.counts[event] = self.counts.get(event, 0) + 1
+        if self.file is not None:
+            self.unwritten.append(entry)
+
+    def clear(self):
+        self.events.clear()
+        self.counts.clear()
+
+    # File output ----------------------------------------------------------------------------------------------------------
+    def open(self, path, flush_every=60, async_writes=False):
+        ''' Write events recorded from now on to path as CSV, flush_every ticks '''
+        self.close()
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(FIELDS)
+        self.flush_every = flush_every
+        if async_writes:
+            self.batches = queue.SimpleQueue()
+            self.thread = threading.Thread(target=self.write_batches, name='combat-log', daemon=True)
+            self.thread.start()
+
+    def end_tick(self):
+        ''' Called by World.update after every tick '''
+        if self.unwritten and self.world.tick % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        if self.file is None or not self.unwritten:
+            return
+        batch, self.unwritten = self.unwritten, []
+        if self.batches is not None:
+            self.batches.put(batch)  # The writer thread does the formatting and the write
+        else:
+            self.writer.writerows(batch)
+            self.file.flush()
+
+    def write_batches(self):
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                break
+            self.writer.writerows(batch)
+            self.file.flush()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.flush()
+        if self.thread is not None:
+            self.batches.put(None)
+            self.thread.join()
+            self.thread = self.batches = None
+        self.file.close()
+        self.file = self.writer = None
@@ -0,0 +1,124 @@
+''' Flow fields (BFS distance maps) over World.grid, cached per goal cell with LRU eviction.
+
+The walls never move once WallGenerator has run, so every agent heading for the same
+goal cell (king zone centre, right-click target) can share one distance map and walk
+down it instead of running its own A*.
+'''
+from collections import OrderedDict, deque
+
+UNREACHED = -1
+
+
+class FlowField:
+    def __init__(self, world, goal):
+        self.world = world
+        self.goal = goal
+        self.grid_width = world.grid_width
+        self.grid_height = world.grid_height
+        self.expanded = 0  # Cells taken off the BFS frontier
+        self.distances = self.build()
+
+    def build(self):
+        ''' Breadth first search outwards from the goal, following World.get_neighbors edges backwards.
+        Moves are only ever made into free cells, so wall cells get a distance (they can be a start)
+        but are never expanded, and a goal inside a wall is unreachable.
+        '''
+        width, height, grid = self.grid_width, self.grid_height, self.world.grid
+        distances = [UNREACHED] * (width * height)
+        gx, gy = self.goal
+        if not (0 <= gx < width and 0 <= gy < height) or grid[gx][gy] != 0:
+            return distances
+
+        distances[gx * height + gy] = 0
+        frontier = deque([self.goal])
+        while frontier:
+            x, y = frontier.popleft()
+            self.expanded += 1
+            next_distance = distances[x * height + y] + 1
+            for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                if 0 <= nx < width and 0 <= ny < height:
+                    index = nx * height + ny
+                    if distances[index] == UNREACHED:
+                        distances[index] = next_distance
+                        if grid[nx][ny] == 0:
+                            frontier.append((nx, ny))
+        return distances
+
+    def distance(self, cell):
+        ''' Steps from cell to the goal, None if the goal can't be reached '''
+        x, y = cell
+        if cell == self.goal:
+            return 0
+        if 0 <= x < self.grid_width and 0 <= y < self.grid_height:
+            distance = self.distances[x * self.grid_height + y]
+            return None if distance == UNREACHED else distance
+        # Off the grid (eg. right/bottom edge strip), one step from its best free neighbour
+        best = None
+        for neighbor in self.world.get_neighbors(cell):
+            distance = self.distance(neighbor)
+            if distance is not None and (best is None or distance < best):
+                best = distance
+        return None if best is None else best + 1
+
+    def next_cell(self, cell):
+        ''' The neighbouring cell one step closer to the goal, None at the goal or if unreachable '''
+        distance = self.distance(cell)
+        if not distance:
+            return None
+        for neighbor in self.world.get_neighbors(cell):
+            if self.distance(neighbor) == distance - 1:
+                return neighbor
+        return None
+
+    def path(self, start):
+        ''' Cells from start to goal inclusive (same length as an A* path), [] if unreachable '''
+        if start == self.goal:
+            return [start]
+        distance = self.distance(start)
+        if distance is None:
+            return []
+        cells = [start]
+        width, height = self.grid_width, self.grid_height
+        if not (0 <= start[0] < width and 0 <= start[1] < height):
+            cells.append(self.next_cell(start))
+            distance -= 1
+        # next_cell inlined, on the grid every step is a plain lookup in the same neighbour order
+        grid, distances = self.world.grid, self.distances
+        x, y = cells[-1]
+        while distance:
+            distance -= 1
+            for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                if 0 <= nx < width and 0 <= ny < height and grid[nx][ny] == 0 and distances[nx * height + ny] == distance:
+                    break
+            x, y = nx, ny
+            cells.append((x, y))
+        return cells
+
+
+class FlowFieldCache:
+    def __init__(self, world, capacity=64):
+        self.world = world
+        self.capacity = capacity
+        self.fields = OrderedDict()  # goal cell -> FlowField, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.expanded = 0  # Summed over every field built
+
+    def get(self, goal):
+        field = self.fields.get(goal)
+        if field is not None:
+            self.hits += 1
+            self.fields.move_to_end(goal)
+            return field
+
+        self.misses += 1
+        field = FlowField(self.world, goal)
+        self.expanded += field.expanded
+        self.fields[goal] = field
+        if len(self.fields) > self.capacity:
+            self.fields.popitem(last=False)
+        return field
+
+    def clear(self):
+        ''' Drop every field, call this if World.grid ever changes '''
+        self.fields.clear()
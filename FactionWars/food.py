@@ -1,6 +1,5 @@
 import pygame
 from vector2d import Vector2D
-from random import randint
 
 class Food:
     def __init__(self, world, position=None, radius=5, color=(0, 255, 0)):
@@ -9,10 +8,39 @@ class Food:
         self.color = color
         self.position = position if position else self.spawn() 
         self.being_held_by = None
+        self.zone_groups = ()  # Groups whose king zone the food is in, refreshed whenever it moves
+        self.refresh_zone()
+        world.food_grid.insert(self, self.position)
+
+    @property
+    def being_held_by(self):
+        ''' The carrying agent, looked up by id so a carrier that died and was removed lets go '''
+        return None if self.holder_id is None else self.world.agents_by_id.get(self.holder_id)
+
+    @being_held_by.setter
+    def being_held_by(self, agent):
+        self.holder_id = None if agent is None else agent.id
 
     def update(self):
-        if self.being_held_by: # If being held by agent, drop it
-            self.position = self.being_held_by.position + Vector2D(self.radius /2 , self.radius / 2)
+        holder = self.being_held_by
+        if holder: # If being held by agent, drop it
+            holder = holder.position
+            self.position.set(holder.x + self.radius / 2, holder.y + self.radius / 2)
+            self.moved()
+
+    def moved(self):
+        ''' Call after changing position, keeps World.food_grid and the king zone flag current '''
+        self.world.food_grid.move(self, self.position)
+        self.refresh_zone()
+
+    def refresh_zone(self):
+        x, y = self.position.x, self.position.y
+        zone_groups = ()
+        for g in (self.world.group1, self.world.group2):
+            zx, zy, width, height = g.king_zone
+            if zx <= x <= zx + width and zy <= y <= zy + height:
+                zone_groups += (g,)
+        self.zone_groups = zone_groups
 
     def render(self, screen):
         pygame.draw.circle(screen, self.color, (int(self.position.x), int(self.position.y)), self.radius)
@@ -23,18 +51,14 @@ class Food:
                 self.being_held_by = agent
 
     def is_in_king_zone(self, group=None):
-        groups = [self.world.group1, self.world.group2]
-        for g in groups:
-            x, y, width, height = g.king_zone
-            if x <= self.position.x <= x + width and y <= self.position.y <= y + height:
-                if group is None or group == g:
-                    return True
-        return False
+        if group is None:
+            return bool(self.zone_groups)
+        return group in self.zone_groups
     
     def spawn(self):
             while True:
-                x = randint(0, self.world.width)
-                y = randint(0, self.world.height)
+                x = self.world.rng.food.randint(0, self.world.width)
+                y = self.world.rng.food.randint(0, self.world.height)
                 position = Vector2D(x, y)
-                if not any(wall.rect.collidepoint(position.x, position.y) for wall in self.world.walls):
+                if not self.world.wall_index.point_in_wall(position.x, position.y):
                     return position
\ No newline at end of file
@@ -1,16 +1,21 @@
 import pygame
+from time import perf_counter
 from vector2d import Vector2D
 from world import World
+from simulation import SimulationThread
+from replay import ReplayRecorder, Replay
 
 class Slider: # For changing agent behaviour weights in real time
-    def __init__(self, x, y, width, height, min_val, max_val, start_val):
+    def __init__(self, x, y, width, height, min_val, max_val, start_val, on_change=None):
         self.rect = pygame.Rect(x, y, width, height)
+        self.on_change = on_change  # Called with the new value whenever the slider moves
         self.min_val = min_val
         self.max_val = max_val
         self.value = start_val
         self.handle_rect = pygame.Rect(x + (start_val - min_val) / (max_val - min_val) * width - 5, y, 10, height)
 
     def update(self, event):
+        value = self.value
         if event.type == pygame.MOUSEBUTTONDOWN:
             if self.rect.collidepoint(event.pos):
                 self.value = (event.pos[0] - self.rect.x) / self.rect.width * (self.max_val - self.min_val) + self.min_val
@@ -19,90 +24,222 @@ class Slider: # For changing agent behaviour weights in real time
             if pygame.mouse.get_pressed()[0] and self.handle_rect.collidepoint(event.pos):
                 self.value = (event.pos[0] - self.rect.x) / self.rect.width * (self.max_val - self.min_val) + self.min_val
                 self.handle_rect.x = max(self.rect.x, min(event.pos[0], self.rect.x + self.rect.width))
+        if self.value != value and self.on_change is not None:
+            self.on_change(self.value)
 
     def draw(self, screen):
         pygame.draw.rect(screen, (240, 240, 240), self.rect)  # Slider background
         pygame.draw.rect(screen, (0, 0, 0), self.handle_rect)  # Slider selector
 
 class Game:
-    def __init__(self, width=1000, height=800):
+    def __init__(self, width=1000, height=800, sim_rate=60, max_steps_per_frame=5, time_scale=1.0, render_fps=60,
+                 interpolate=True, threaded=False, seed=None, record=None, replay=None, keyframe_interval=300):
+        # record: write the match to this replay file. replay: watch one instead of playing (arrows seek)
+        self.replay = Replay(replay) if replay is not None else None
+        if self.replay is not None:
+            width, height = self.replay.params['width'], self.replay.params['height']
+            threaded = False
         pygame.init()
         self.screen = pygame.display.set_mode((width, height))
         pygame.display.set_caption('Faction Wars')
         self.clock = pygame.time.Clock()
         self.font = pygame.font.Font(None, 30)
         self.count = pygame.font.Font(None, 22)
-        self.world = World(width, height)
-
-        # Sliders for groups behaviour weights
+        if self.replay is not None:
+            self.world = self.replay.seek(0)
+        else:
+            self.world = World(width, height, seed=seed)
+            if record is not None:
+                self.world.path_planner.max_plans = 32  # Same on every machine, unlike a time budget
+            else:
+                self.world.path_planner.budget_ms = 4.0  # Spread big path bursts (eg. right-click orders) over frames
+        # Fixed timestep: the world always steps by delta_time (the old 60 FPS step at the default sim_rate),
+        # as many times per frame as real time (times time_scale) calls for, capped at max_steps_per_frame
+        self.sim_rate = sim_rate
+        self.step_seconds = 1.0 / sim_rate
+        self.delta_time = (1000.0 / sim_rate) / 80.0
+        self.max_steps_per_frame = max_steps_per_frame
+        self.time_scale = time_scale
+        self.render_fps = render_fps
+        self.interpolate = interpolate
+        self.accumulator = 0.0
+        self.texts = {}  # name -> (string, rendered surface), re-rendered only when the string changes
+        # threaded: World.update runs on a SimulationThread at sim_rate and the loop below only draws its snapshots
+        self.simulation = SimulationThread(self.world, self.delta_time, sim_rate * time_scale) if threaded else None
+        # Profiler overlay under the sliders, F3 toggles it (and the profiling), F4 exports what was collected
+        self.profiler = self.world.profiler
+        self.overlay_pos = (width - 150, 320)
+        self.overlay_lines = []
+        self.overlay_refreshed = 0.0
+
+        # Sliders for groups behaviour weights, each change is pushed to the group once
+        group1, group2 = self.world.group1, self.world.group2
         self.sliders = {
-            'cohesion_group1': Slider(width - 150, 50, 150, 10, 0, 1, self.world.group1.cohesion_weight),
-            'separation_group1': Slider(width - 150, 70, 150, 10, 0, 1, self.world.group1.separation_weight),
-            'alignment_group1': Slider(width - 150, 90, 150, 10, 0, 1, self.world.group1.alignment_weight),
-            'wander_group1': Slider(width - 150, 110, 150, 10, 0, 1, self.world.group1.wander_weight),
-            'cohesion_group2': Slider(width - 150, 150, 150, 10, 0, 1, self.world.group2.cohesion_weight),
-            'separation_group2': Slider(width - 150, 170, 150, 10, 0, 1, self.world.group2.separation_weight),
-            'alignment_group2': Slider(width - 150, 190, 150, 10, 0, 1, self.world.group2.alignment_weight),
-            'wander_group2': Slider(width - 150, 210, 150, 10, 0, 1, self.world.group2.wander_weight),
-            'max_speed': Slider(width - 150, 300, 150, 10, 1, 25, 10),
+            'cohesion_group1': Slider(width - 150, 50, 150, 10, 0, 1, group1.cohesion_weight,
+                                      self.weight_setter(1, 'cohesion_weight')),
+            'separation_group1': Slider(width - 150, 70, 150, 10, 0, 1, group1.separation_weight,
+                                        self.weight_setter(1, 'separation_weight')),
+            'alignment_group1': Slider(width - 150, 90, 150, 10, 0, 1, group1.alignment_weight,
+                                       self.weight_setter(1, 'alignment_weight')),
+            'wander_group1': Slider(width - 150, 110, 150, 10, 0, 1, group1.wander_weight,
+                                    self.weight_setter(1, 'wander_weight')),
+            'cohesion_group2': Slider(width - 150, 150, 150, 10, 0, 1, group2.cohesion_weight,
+                                      self.weight_setter(2, 'cohesion_weight')),
+            'separation_group2': Slider(width - 150, 170, 150, 10, 0, 1, group2.separation_weight,
+                                        self.weight_setter(2, 'separation_weight')),
+            'alignment_group2': Slider(width - 150, 190, 150, 10, 0, 1, group2.alignment_weight,
+                                       self.weight_setter(2, 'alignment_weight')),
+            'wander_group2': Slider(width - 150, 210, 150, 10, 0, 1, group2.wander_weight,
+                                    self.weight_setter(2, 'wander_weight')),
+            'max_speed': Slider(width - 150, 300, 150, 10, 1, 25, 10, self.set_max_speed),
         }
+        self.set_max_speed(self.sliders['max_speed'].value)
+        self.recorder = ReplayRecorder(self.world, record, self.delta_time, keyframe_interval) if record is not None else None
+
+    def step(self):
+        ''' Run the fixed steps owed for the time accumulated so far, returns how far into the next step we are (0-1) '''
+        steps = int(self.accumulator / self.step_seconds)
+        if steps > self.max_steps_per_frame:
+            # Can't keep up, drop the backlog (slow motion) rather than take ever more steps per frame
+            steps = self.max_steps_per_frame
+            self.accumulator = steps * self.step_seconds
+        for i in range(steps):
+            if i == steps - 1:
+                self.world.renderer.capture()
+            if self.replay is None:
+                self.world.update(self.delta_time)
+            elif self.world.tick < self.replay.end_tick:
+                self.replay.step(self.world)
+        self.accumulator -= steps * self.step_seconds
+        return self.accumulator / self.step_seconds
+
+    def text(self, name, font, string):
+        cached = self.texts.get(name)
+        if cached is None or cached[0] != string:
+            cached = (string, font.render(string, True, pygame.Color('black')))
+            self.texts[name] = cached
+        return cached[1]
+
+    def send(self, command):
+        ''' Run command(world) now, or on the simulation thread before its next tick '''
+        if self.replay is not None:
+            return  # Watching a replay, the inputs come from the recording
+        if self.simulation is not None:
+            self.simulation.submit(command)
+        else:
+            command(self.world)
+
+    def weight_setter(self, group_number, name):
+        def set_weight(value):
+            with self.profiler.phase('sliders'):
+                self.send(lambda world: world.apply_input('weight', group_number, name, value))
+        return set_weight
+
+    def set_max_speed(self, value):
+        with self.profiler.phase('sliders'):
+            self.send(lambda world: world.apply_input('max_speed', value))
+
+    def seek(self, tick):
+        ''' Replays only, jump to tick (clamped to the recording) '''
+        tick = max(self.replay.keyframe_ticks[0], min(tick, self.replay.end_tick))
+        self.world = self.replay.seek(tick, self.world)
+        self.world.renderer.capture()
+        self.accumulator = 0.0
+
+    def toggle_profiler(self):
+        self.profiler.enabled = not self.profiler.enabled
+        if self.profiler.enabled:
+            self.profiler.reset()
+        self.overlay_lines = []
+
+    def export_profile(self, csv_path='profile.csv', trace_path='profile_trace.json'):
+        self.profiler.export_csv(csv_path)
+        self.profiler.export_chrome_trace(trace_path)
+
+    def draw_overlay(self):
+        now = perf_counter()
+        if now - self.overlay_refreshed > 0.5:  # Re-render the text a couple of times a second, not every frame
+            self.overlay_refreshed = now
+            lines = ['phase   mean / p95 ms']
+            for phase, stats in self.profiler.summary().items():
+                lines.append(f"{phase}  {stats['mean_ms']:.2f} / {stats['p95_ms']:.2f}")
+            self.overlay_lines = [self.count.render(line, True, pygame.Color('black')) for line in lines]
+        x, y = self.overlay_pos
+        for surface in self.overlay_lines:
+            self.screen.blit(surface, (x, y))
+            y += 16
+
+    def order_attack(self, world, target):
+        world.apply_input('attack', target.x, target.y)
 
     def run(self):
+        if self.simulation is not None:
+            self.simulation.start()
+        profiler = self.profiler
         running = True
         while running:
-            delta_time = self.clock.tick(60) / 80.0  # Delta time in seconds
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-
-                for slider in self.sliders.values():
-                    slider.update(event)
-
-                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:  # Right-click
-                    target = Vector2D(event.pos[0], event.pos[1])
-                    self.world.group1.world_target = target
-                    self.world.group2.world_target = target
-                    self.world.group1.attack()
-                    self.world.group2.attack()
-                       
+            self.accumulator += self.clock.tick(self.render_fps) / 1000.0 * self.time_scale
+            frame_start = perf_counter()
+
+            with profiler.phase('events'):
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        running = False
+
+                    for slider in self.sliders.values():
+                        slider.update(event)
+
+                    if event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:  # Right-click
+                        target = Vector2D(event.pos[0], event.pos[1])
+                        self.send(lambda world, target=target: self.order_attack(world, target))
+
+                    if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                        self.toggle_profiler()
+                    elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                        self.export_profile()
+                    elif event.type == pygame.KEYDOWN and self.replay is not None:
+                        if event.key == pygame.K_RIGHT:
+                            self.seek(self.world.tick + 10 * self.sim_rate)
+                        elif event.key == pygame.K_LEFT:
+                            self.seek(self.world.tick - 10 * self.sim_rate)
                         
-            # Update weights based on slider values
-            self.world.group1.apply_behavior_weights(
-                self.sliders['cohesion_group1'].value,
-                self.sliders['separation_group1'].value,
-                self.sliders['alignment_group1'].value,
-                self.sliders['wander_group1'].value,
-            )
-            self.world.group2.apply_behavior_weights(
-                self.sliders['cohesion_group2'].value,
-                self.sliders['separation_group2'].value,
-                self.sliders['alignment_group2'].value,
-                self.sliders['wander_group2'].value,
-            )
-            max_speed = self.sliders['max_speed'].value
-            for agent in self.world.group1.agents + self.world.group2.agents:
-                agent.max_speed = max_speed
-
-            self.world.update(delta_time)
-            self.world.render(self.screen)
-
-            # Text
-            fps = int(self.clock.get_fps())
-            fps_text = self.font.render(f"FPS: {fps}", True, pygame.Color('black'))
-            self.screen.blit(fps_text, (10, 10))
-
-            group1 = len(self.world.group1.agents)
-            group2 = len(self.world.group2.agents)
-            counts = self.count.render(f"Red: {group1} Blue {group2}", True, pygame.Color('black'))
-            self.screen.blit(counts, (430, 10))
-
-            # Draw sliders
-            for slider in self.sliders.values():
-                slider.draw(self.screen)
-
-            pygame.display.flip()
-
+            if self.simulation is not None:
+                snapshot = self.simulation.latest()
+                with profiler.phase('render'):
+                    self.world.renderer.render_snapshot(self.screen, snapshot)
+                group1, group2 = snapshot.counts
+            else:
+                with profiler.phase('simulation'):
+                    alpha = self.step()
+                with profiler.phase('render'):
+                    self.world.render(self.screen, alpha if self.interpolate else 1.0)
+                group1 = len(self.world.group1.agents)
+                group2 = len(self.world.group2.agents)
+
+            with profiler.phase('ui'):
+                # Text
+                fps = int(self.clock.get_fps())
+                self.screen.blit(self.text('fps', self.font, f"FPS: {fps}"), (10, 10))
+                self.screen.blit(self.text('counts', self.count, f"Red: {group1} Blue {group2}"), (430, 10))
+                if self.replay is not None:
+                    self.screen.blit(self.text('tick', self.count, f"Tick {self.world.tick} / {self.replay.end_tick}"),
+                                     (600, 10))
+
+                # Draw sliders
+                for slider in self.sliders.values():
+                    slider.draw(self.screen)
+                if profiler.enabled:
+                    self.draw_overlay()
+
+            with profiler.phase('present'):
+                pygame.display.flip()
+            if profiler.enabled:
+                profiler.record('frame', perf_counter() - frame_start, frame_start)
+
+        if self.simulation is not None:
+            self.simulation.stop()
+        if self.recorder is not None:
+            self.recorder.close()
         pygame.quit()
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+''' Headless batch runner. Steps a World with a fixed delta_time as fast as the CPU allows,
+no window, font or Game sliders. Baseline for throughput benchmarks and Monte Carlo runs.
+'''
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import contextlib
+import json
+import time
+from world import World
+from combat_log import HITS
+from replay import ReplayRecorder
+
+DEFAULT_DELTA_TIME = (1000 / 60) / 80.0  # What Game.run steps with at a steady 60 FPS
+
+
+def summarise(world, elapsed, ticks_to_extinction):
+    groups = {'group1': world.group1, 'group2': world.group2}
+    return {
+        'seed': world.seed,  # Also set when the caller passed none, enough to replay the match
+        'ticks': world.tick,
+        'survivors': {name: len(group.agents) for name, group in groups.items()},
+        'food_delivered': {name: group.food_delivered for name, group in groups.items()},
+        'ticks_to_extinction': ticks_to_extinction,
+        'elapsed': elapsed,
+        'ticks_per_second': world.tick / elapsed if elapsed > 0 else 0.0,
+        'paths': world.path_stats.sample(),
+    }
+
+
+def run_match(ticks=5000, delta_time=DEFAULT_DELTA_TIME, seed=None, width=1000, height=800, num_agents=200,
+              engine=None, stop_on_extinction=True, setup=None, combat_log=None, record=None):
+    ''' Build a World and step it headless. Returns a dict of summary stats.
+
+    ticks_to_extinction is the tick on which the first faction ran out of agents, None if both survived.
+    setup, if given, is called with the World before the first step (set weights, targets, ...).
+    combat_log, if given, is a path the hits and kills are written to as CSV.
+    record, if given, is a path the match is written to as a replay (see replay.py).
+    '''
+    with contextlib.ExitStack() as stack:
+        world = World(width, height, engine=engine, num_agents=num_agents, seed=seed)
+        if setup is not None:
+            setup(world)
+        if combat_log is not None:
+            world.combat_log.level = HITS
+            world.combat_log.open(combat_log)
+            stack.callback(world.combat_log.close)
+        if record is not None:
+            stack.callback(ReplayRecorder(world, record, delta_time).close)
+
+        ticks_to_extinction = None
+        start = time.perf_counter()
+        for _ in range(ticks):
+            world.update(delta_time)
+            if ticks_to_extinction is None and (not world.group1.agents or not world.group2.agents):
+                ticks_to_extinction = world.tick
+                if stop_on_extinction:
+                    break
+        elapsed = time.perf_counter() - start
+
+    return summarise(world, elapsed, ticks_to_extinction)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run Faction Wars matches headless')
+    parser.add_argument('--ticks', type=int, default=5000)
+    parser.add_argument('--delta-time', type=float, default=DEFAULT_DELTA_TIME)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--matches', type=int, default=1)
+    parser.add_argument('--agents', type=int, default=200, help='Agents per group')
+    parser.add_argument('--width', type=int, default=1000)
+    parser.add_argument('--height', type=int, default=800)
+    parser.add_argument('--engine', choices=['array'], default=None)
+    parser.add_argument('--combat-log', default=None, help='Write hits and kills to this CSV, each match overwrites it')
+    parser.add_argument('--record', default=None, help='Write a replay to this path, each match overwrites it')
+    args = parser.parse_args()
+
+    for match in range(args.matches):
+        seed = None if args.seed is None else args.seed + match
+        stats = run_match(args.ticks, args.delta_time, seed, args.width, args.height, args.agents, args.engine,
+                          combat_log=args.combat_log, record=args.record)
+        print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+''' Hierarchical pathfinding (HPA*) over World.grid for large maps.
+
+The grid is cut into square clusters. Where two neighbouring clusters share a run of free
+cells along their border, one or two entrances (pairs of facing cells) are placed. Entrances
+inside the same cluster are linked by abstract edges weighted with their in-cluster BFS
+distance. That abstract graph is built once, after World.initialize_grid.
+
+A query hooks its start and goal cells into the abstract graph with one BFS each inside
+their own clusters, runs A* over the (much smaller) abstract graph, then refines each hop
+into grid cells with a BFS that never leaves the hop's cluster.
+'''
+import heapq
+from collections import OrderedDict, deque
+
+DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))  # Same order as World.get_neighbors
+
+
+class HierarchicalPlanner:
+    def __init__(self, world, cluster_size=20, max_entrance_width=6, segment_cache_size=4096):
+        self.world = world
+        self.grid = world.grid
+        self.width = world.grid_width
+        self.height = world.grid_height
+        self.cluster_size = cluster_size
+        self.max_entrance_width = max_entrance_width  # Wider border runs get an entrance at each end
+        self.edges = {}  # abstract node cell -> list of (cell, cost)
+        self.cluster_nodes = {}  # cluster -> list of abstract node cells in it
+        self.segments = OrderedDict()  # (from cell, to cell) -> refined cells, LRU
+        self.segment_cache_size = segment_cache_size
+        self.build()
+        # Query counters for World.path_stats, building doesn't count
+        self.expanded = 0  # Cells reached by the local BFSs plus abstract nodes closed
+        self.segment_hits = 0
+        self.segment_misses = 0
+
+    # Building -------------------------------------------------------------------------------------------------------------
+    def cluster_of(self, cell):
+        return (cell[0] // self.cluster_size, cell[1] // self.cluster_size)
+
+    def cluster_bounds(self, cluster):
+        size = self.cluster_size
+        x0, y0 = cluster[0] * size, cluster[1] * size
+        return x0, y0, min(x0 + size, self.width), min(y0 + size, self.height)
+
+    def is_free(self, x, y):
+        return self.grid[x][y] == 0
+
+    def add_node(self, cell):
+        if cell not in self.edges:
+            self.edges[cell] = []
+            self.cluster_nodes.setdefault(self.cluster_of(cell), []).append(cell)
+
+    def add_entrances(self, border_cells):
+        ''' border_cells: list of (cell in first cluster, facing cell in second cluster) along one border '''
+        run = []
+        for inside, outside in border_cells + [(None, None)]:
+            if inside is not None and self.is_free(*inside) and self.is_free(*outside):
+                run.append((inside, outside))
+                continue
+            if run:
+                if len(run) < self.max_entrance_width:
+                    picks = [run[len(run) // 2]]
+                else:
+                    picks = [run[0], run[-1]]
+                for a, b in picks:
+                    self.add_node(a)
+                    self.add_node(b)
+                    self.edges[a].append((b, 1))
+                    self.edges[b].append((a, 1))
+                run = []
+
+    def build(self):
+        size = self.cluster_size
+        clusters_x = -(-self.width // size)
+        clusters_y = -(-self.height // size)
+
+        for cx in range(clusters_x):
+            for cy in range(clusters_y):
+                x0, y0, x1, y1 = self.cluster_bounds((cx, cy))
+                if x1 < self.width:  # Border with the cluster to the right
+                    self.add_entrances([((x1 - 1, y), (x1, y)) for y in range(y0, y1)])
+                if y1 < self.height:  # Border with the cluster below
+                    self.add_entrances([((x, y1 - 1), (x, y1)) for x in range(x0, x1)])
+
+        for cluster, nodes in self.cluster_nodes.items():
+            targets = set(nodes)
+            for node in nodes:
+                distances, _ = self.cluster_bfs(node, cluster, targets)
+                for other in nodes:
+                    if other != node and other in distances:
+                        self.edges[node].append((other, distances[other]))
+
+    # Local searches -------------------------------------------------------------------------------------------------------
+    def cluster_bfs(self, source, cluster, targets=None):
+        ''' BFS from source that stays inside cluster. Like World.get_neighbors, moves only go into
+        free cells (source itself may be a wall). Stops early once every cell in targets is found.
+        Returns (distances, parents). '''
+        x0, y0, x1, y1 = self.cluster_bounds(cluster)
+        grid = self.grid
+        distances = {source: 0}
+        parents = {source: None}
+        frontier = deque([source])
+        remaining = None if targets is None else len(targets) - (source in targets)
+        if remaining == 0:
+            return distances, parents
+        while frontier:
+            cell = frontier.popleft()
+            x, y = cell
+            next_distance = distances[cell] + 1
+            for dx, dy in DIRECTIONS:
+                nx, ny = x + dx, y + dy
+                if x0 <= nx < x1 and y0 <= ny < y1 and grid[nx][ny] == 0 and (nx, ny) not in distances:
+                    distances[(nx, ny)] = next_distance
+                    parents[(nx, ny)] = cell
+                    if remaining is not None and (nx, ny) in targets:
+                        remaining -= 1
+                        if not remaining:
+                            return distances, parents
+                    frontier.append((nx, ny))
+        return distances, parents
+
+    def straight_walk(self, a, b):
+        ''' The L shaped walk from a to b (x first, then y) if every cell on it is free, else None.
+        It is as short as a path can be, so on open ground it saves a BFS. '''
+        grid = self.grid
+        cells = []
+        x, y = a
+        step = 1 if b[0] > x else -1
+        while x != b[0]:
+            x += step
+            if grid[x][y] != 0:
+                return None
+            cells.append((x, y))
+        step = 1 if b[1] > y else -1
+        while y != b[1]:
+            y += step
+            if grid[x][y] != 0:
+                return None
+            cells.append((x, y))
+        return cells
+
+    def segment(self, a, b):
+        ''' Cells after a up to and including b, for two cells in the same cluster '''
+        key = (a, b)
+        cells = self.segments.get(key)
+        if cells is not None:
+            self.segment_hits += 1
+            self.segments.move_to_end(key)
+            return cells
+        self.segment_misses += 1
+        cells = self.straight_walk(a, b)
+        if cells is None:
+            _, parents = self.cluster_bfs(a, self.cluster_of(a), {b})
+            self.expanded += len(parents)
+            cells = []
+            cell = b
+            while cell != a:
+                cells.append(cell)
+                cell = parents[cell]
+            cells.reverse()
+        self.segments[key] = cells
+        if len(self.segments) > self.segment_cache_size:
+            self.segments.popitem(last=False)
+        return cells
+
+    # Queries --------------------------------------------------------------------------------------------------------------
+    def find_path(self, start, goal):
+        ''' Cells from start to goal inclusive, [] if unreachable. Near optimal, not always shortest. '''
+        if start == goal:
+            return [start]
+        gx, gy = goal
+        if not (0 <= gx < self.width and 0 <= gy < self.height) or not self.is_free(gx, gy):
+            return []
+
+        start_cluster = self.cluster_of(start)
+        goal_cluster = self.cluster_of(goal)
+        start_nodes = self.cluster_nodes.get(start_cluster, [])
+        goal_nodes = self.cluster_nodes.get(goal_cluster, [])
+        start_targets = set(start_nodes)
+        if goal_cluster == start_cluster:
+            start_targets.add(goal)
+        start_distances, start_parents = self.cluster_bfs(start, start_cluster, start_targets)
+        # Every cell on the way is free, so a BFS out from the goal gives distances to it
+        goal_distances, goal_parents = self.cluster_bfs(goal, goal_cluster, set(goal_nodes))
+        self.expanded += len(start_distances) + len(goal_distances)
+
+        start_edges = [(node, start_distances[node]) for node in start_nodes if node in start_distances]
+        if goal in start_distances:
+            start_edges.append((goal, start_distances[goal]))
+        goal_edges = {node: goal_distances[node] for node in goal_nodes if node in goal_distances}
+
+        abstract = self.abstract_search(start, goal, start_edges, goal_edges)
+        if abstract is None:
+            return []
+
+        cells = [start]
+        for a, b in zip(abstract, abstract[1:]):
+            if a == b:
+                continue
+            if abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1 and self.cluster_of(a) != self.cluster_of(b):
+                hop = [b]  # Entrance crossing
+            elif a == start:
+                hop = []
+                cell = b
+                while cell != start:
+                    hop.append(cell)
+                    cell = start_parents[cell]
+                hop.reverse()
+            elif b == goal:
+                hop = []
+                cell = goal_parents[a]
+                while cell is not None:
+                    hop.append(cell)
+                    cell = goal_parents[cell]
+            else:
+                hop = self.segment(a, b)
+            cells.extend(hop)
+        return cells
+
+    def abstract_search(self, start, goal, start_edges, goal_edges):
+        ''' A* over the abstract graph with start and goal hooked in temporarily '''
+        gx, gy = goal
+        edges = self.edges
+        best_g = {start: 0}
+        parents = {start: None}
+        closed = set()
+        h = abs(start[0] - gx) + abs(start[1] - gy)
+        frontier = [(h, h, 0, start)]  # Ties on f broken on h, keeps open maps from flooding
+        while frontier:
+            _, _, g, node = heapq.heappop(frontier)
+            if node in closed:
+                continue
+            closed.add(node)
+            self.expanded += 1
+            if node == goal:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parents[node]
+                path.reverse()
+                return path
+
+            neighbors = start_edges + edges.get(node, []) if node == start else edges.get(node, ())
+            if node in goal_edges:
+                neighbors = list(neighbors) + [(goal, goal_edges[node])]
+            for child, cost in neighbors:
+                child_g = g + cost
+                if child in closed or child_g >= best_g.get(child, float('inf')):
+                    continue
+                best_g[child] = child_g
+                parents[child] = node
+                h = abs(child[0] - gx) + abs(child[1] - gy)
+                heapq.heappush(frontier, (child_g + h, h, child_g, child))
+        return None
@@ -1,8 +1,22 @@
-'''3x3 matrix class for 2d operations on 2d points. Only used for Wander steering behavior in this project.
+'''3x3 matrix class for 2d operations on 2d points (scale, rotate, translate).
+
+With numpy installed a Matrix33 can also transform a whole (N, 2) array of points at once, and the
+*_stack functions below build and compose (N, 3, 3) stacks holding one matrix per agent. Row vector
+convention as in transform_vector2d: out = pts @ M[:2, :2] + M[2, :2].
 '''
 
 from math import cos, sin
 
+try:
+    import numpy as np
+except ImportError:  # Only the array methods need it
+    np = None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("numpy is required for array transforms")
+
 
 class Matrix33(object):
     '''3x3 matrix for two-dimensional operations.'''
@@ -72,6 +86,25 @@ class Matrix33(object):
         pt.x = tmp_x
         pt.y = tmp_y
 
+    def as_array(self):
+        ''' Self as a (3, 3) float array '''
+        _require_numpy()
+        return np.array(self._m, dtype=float).reshape(3, 3)
+
+    def transform_array(self, points, out=None):
+        ''' Apply self to an (N, 2) float array of points. Returns a new array, or writes
+        into out (which may be points itself) '''
+        _require_numpy()
+        a11, a12, a13, a21, a22, a23, a31, a32, a33 = self._m
+        points = np.asarray(points, dtype=float)
+        if out is None:
+            out = np.empty_like(points)
+        x = points[:, 0].copy() if out is points else points[:, 0]
+        y = points[:, 1]
+        out[:, 0] = a11*x + a21*y + a31
+        out[:, 1] = a12*x + a22*y + a32
+        return out
+
     def __mul__(self, rhs):  # the self * rhs operator
         ''' 3x3 matrix matrix multiplication. Rarely used however...'''
         a11, a12, a13,  a21, a22, a23,  a31, a32, a33 = self._m
@@ -127,4 +160,62 @@ class Matrix33(object):
         ]
 
     def __str__(self):
-        return '[%5.1f, %5.1f, %5.1f]\n[%5.1f, %5.1f, %5.1f]\n[%5.1f, %5.1f, %5.1f]' % tuple(self._m)
\ No newline at end of file
+        return '[%5.1f, %5.1f, %5.1f]\n[%5.1f, %5.1f, %5.1f]\n[%5.1f, %5.1f, %5.1f]' % tuple(self._m)
+
+
+# Per-agent matrix stacks ------------------------------------------------------------------------------------------------
+def identity_stack(n):
+    ''' (n, 3, 3) stack of identity matrices '''
+    _require_numpy()
+    return np.tile(np.eye(3), (n, 1, 1))
+
+
+def scale_stack(xscale, yscale):
+    ''' One scale matrix per row of xscale / yscale (arrays of length N) '''
+    _require_numpy()
+    xscale = np.asarray(xscale, dtype=float)
+    stack = identity_stack(len(xscale))
+    stack[:, 0, 0] = xscale
+    stack[:, 1, 1] = yscale
+    return stack
+
+
+def rotate_by_vectors_stack(fwd, side):
+    ''' One rotate_by_vectors matrix per row of the (N, 2) fwd and side arrays '''
+    _require_numpy()
+    fwd = np.asarray(fwd, dtype=float)
+    stack = identity_stack(len(fwd))
+    stack[:, 0, :2] = fwd
+    stack[:, 1, :2] = side
+    return stack
+
+
+def translate_stack(offsets):
+    ''' One translation matrix per row of the (N, 2) offsets array '''
+    _require_numpy()
+    offsets = np.asarray(offsets, dtype=float)
+    stack = identity_stack(len(offsets))
+    stack[:, 2, :2] = offsets
+    return stack
+
+
+def compose_stacks(*stacks):
+    ''' Row by row product of stacks in the order given, like m1 * m2 * ... for single matrices.
+    A Matrix33 or (3, 3) array among them is shared by every row. '''
+    _require_numpy()
+    result = None
+    for stack in stacks:
+        stack = stack.as_array() if isinstance(stack, Matrix33) else np.asarray(stack, dtype=float)
+        result = stack if result is None else np.matmul(result, stack)
+    return result
+
+
+def transform_stack(stack, points, out=None):
+    ''' Transform row i of the (N, 2) points array by matrix i of the (N, 3, 3) stack '''
+    _require_numpy()
+    points = np.asarray(points, dtype=float)
+    result = np.einsum('ni,nij->nj', points, stack[:, :2, :2]) + stack[:, 2, :2]
+    if out is None:
+        return result
+    out[:] = result
+    return out
@@ -0,0 +1,175 @@
+''' Batched path requests with a per-frame planning budget.
+
+When a whole group is ordered to attack, every agent wants a path on the same tick. Agents
+hand their request to World.path_planner instead, which merges identical (start cell, goal
+cell) requests and only plans for budget_ms milliseconds per frame. Whatever doesn't fit
+waits for the next frame, and the agent just seeks straight at its target until then.
+
+World.path_stats counts what planning costs (plans per tick, nodes expanded, failures,
+latency, cache hits) so budget_ms can be sized from a real run rather than guessed.
+'''
+from collections import OrderedDict, deque
+from time import perf_counter
+from profiler import RollingHistogram
+
+
+class PathStats:
+    def __init__(self, world, window=1000):
+        self.world = world
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.requests = 0  # PathPlanner.request calls
+        self.merged = 0  # ... answered by a request already solved or waiting this frame
+        self.dropped = 0  # ... abandoned by every agent waiting on them before they were solved
+        self.plans = 0  # World.plan_path calls
+        self.failed = 0  # ... that found no path
+        self.astar_expanded = 0  # Flat A* only, flow fields and HPA keep their own counters
+        self.agents_without_path = 0  # Agents handed an empty path, they seek straight at the target instead
+        self.plans_this_tick = 0
+        self.plans_per_tick = deque(maxlen=self.window)
+        self.latency = RollingHistogram(self.window)  # ms per plan_path call
+        self.baseline = self.backend_counters()  # Backend counters keep running, remember where they stood
+        self.carried = (0, 0, 0)  # Counted by backends since replaced, see backend_replaced
+
+    def backend_counters(self):
+        ''' (nodes expanded, cache hits, cache misses) from the flow field cache or the HPA planner '''
+        world = self.world
+        if world.path_mode == 'flow':
+            cache = world.flow_fields
+            return cache.expanded, cache.hits, cache.misses
+        if world.path_mode == 'hpa':
+            planner = world.hierarchical
+            return planner.expanded, planner.segment_hits, planner.segment_misses
+        return 0, 0, 0
+
+    def backend_replaced(self, counters):
+        ''' World.grid_changed built a new backend whose counters start from 0, counters is where the old
+        one stood. Carry what it counted since the baseline over and measure the new one from here. '''
+        self.carried = tuple(carried + now - then for carried, now, then in zip(self.carried, counters, self.baseline))
+        self.baseline = self.backend_counters()
+
+    def begin_tick(self):
+        self.plans_per_tick.append(self.plans_this_tick)
+        self.plans_this_tick = 0
+
+    def planned(self, seconds, found, expanded=0):
+        self.plans += 1
+        self.plans_this_tick += 1
+        self.astar_expanded += expanded
+        if not found:
+            self.failed += 1
+        self.latency.add(seconds * 1000.0)
+
+    def sample(self):
+        ''' Counters since the last reset as a plain dict, cheap enough to poll every frame '''
+        expanded, hits, misses = (carried + now - then for carried, now, then
+                                  in zip(self.carried, self.backend_counters(), self.baseline))
+        expanded += self.astar_expanded
+        per_tick = self.plans_per_tick
+        latency = self.latency
+        return {
+            'tick': self.world.tick,
+            'requests': self.requests,
+            'merged_requests': self.merged,
+            'dropped_requests': self.dropped,
+            'pending': len(self.world.path_planner.pending),
+            'plans': self.plans,
+            'plans_last_tick': per_tick[-1] if per_tick else 0,
+            'plans_per_tick_mean': sum(per_tick) / len(per_tick) if per_tick else 0.0,
+            'plans_per_tick_max': max(per_tick, default=0),
+            'nodes_expanded': expanded,
+            'nodes_per_plan': expanded / self.plans if self.plans else 0.0,
+            'failed_plans': self.failed,
+            'agents_without_path': self.agents_without_path,
+            'latency_mean_ms': latency.mean(),
+            'latency_p50_ms': latency.percentile(50),
+            'latency_p95_ms': latency.percentile(95),
+            'latency_p99_ms': latency.percentile(99),
+            'latency_max_ms': max(latency.samples, default=0.0),
+            'cache_hits': hits,
+            'cache_misses': misses,
+            'cache_hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+
+class PathRequest:
+    def __init__(self, key, start, goal):
+        self.key = key  # (start cell, goal cell)
+        self.start = start
+        self.goal = goal
+        self.done = False
+        self.path = []  # Shared by everyone who asked, take a copy before popping waypoints
+        self.holders = 0  # Agents that asked and haven't let go, see PathPlanner.release
+
+    @property
+    def goal_cell(self):
+        return self.key[1]
+
+
+class PathPlanner:
+    def __init__(self, world, budget_ms=None, max_plans=None):
+        self.world = world
+        self.budget_ms = budget_ms  # None plans everything straight away
+        # Plans per frame, a budget that comes out the same on every machine (replays need that)
+        self.max_plans = max_plans
+        self.plans = 0  # Solved this frame
+        self.pending = OrderedDict()  # key -> PathRequest, oldest first
+        self.finished = {}  # key -> PathRequest solved this frame, so repeats in the same frame are free
+        self.deadline = None
+
+    def begin_frame(self):
+        ''' Reset the budget and spend it on the oldest waiting requests first '''
+        self.finished.clear()
+        self.plans = 0
+        self.deadline = None if self.budget_ms is None else perf_counter() + self.budget_ms / 1000.0
+        while self.pending and self.has_budget():
+            _, request = self.pending.popitem(last=False)
+            self.solve(request)
+
+    def has_budget(self):
+        if self.max_plans is not None and self.plans >= self.max_plans:
+            return False
+        return self.deadline is None or perf_counter() < self.deadline
+
+    def request(self, start, goal):
+        world = self.world
+        key = (world.world_to_grid(start), world.world_to_grid(goal))
+        stats = world.path_stats
+        stats.requests += 1
+        request = self.finished.get(key) or self.pending.get(key)
+        if request is not None:
+            stats.merged += 1
+            request.holders += 1
+            return request
+
+        request = PathRequest(key, start.copy(), goal.copy())
+        request.holders = 1
+        if not self.pending and self.has_budget():
+            self.solve(request)
+        else:
+            self.pending[key] = request
+        return request
+
+    def release(self, request):
+        ''' An agent no longer wants request (re-targeted, ordered to attack, killed). Once nobody
+        waits on a pending request it is dropped instead of being solved in its turn. '''
+        request.holders -= 1
+        if request.holders <= 0 and self.pending.get(request.key) is request:
+            del self.pending[request.key]
+            self.world.path_stats.dropped += 1
+
+    def solve(self, request):
+        start = perf_counter()
+        request.path = self.world.plan_path(request.start, request.goal)
+        request.done = True
+        self.plans += 1
+        profiler = self.world.profiler
+        if profiler.enabled:
+            profiler.add('pathfinding', perf_counter() - start)  # Also counted in the caller's phase
+        self.finished[request.key] = request
+
+    def clear(self):
+        self.pending.clear()
+        self.finished.clear()
@@ -0,0 +1,149 @@
+''' Per-phase timings for the game loop and World.update.
+
+Phases that run many times per tick (one per agent) are summed with add/lap and folded into
+their histograms once per tick by flush, so a phase costs one perf_counter call per use and
+a dict update, nothing when the profiler is disabled. Each histogram keeps the last window
+samples and rolling bucket counts over them.
+
+Whole-phase samples also go into a bounded trace buffer that export_chrome_trace writes in
+the Trace Event Format (load it in chrome://tracing or Perfetto).
+
+With Game(threaded=True) the simulation thread records and flushes while the UI thread resets,
+draws the summary and exports, so everything that touches the histograms or the trace holds
+the lock. add and lap only run on the thread that flushes, they stay lock free.
+'''
+import csv
+import json
+import threading
+from bisect import bisect_right
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+
+BUCKETS_MS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250)  # Upper edges, last bucket is open
+
+
+class RollingHistogram:
+    def __init__(self, window=300):
+        self.samples = deque(maxlen=window)  # ms
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0.0
+
+    def add(self, ms):
+        samples = self.samples
+        if len(samples) == samples.maxlen:
+            evicted = samples[0]
+            self.counts[bisect_right(BUCKETS_MS, evicted)] -= 1
+            self.total -= evicted
+        samples.append(ms)
+        self.counts[bisect_right(BUCKETS_MS, ms)] += 1
+        self.total += ms
+
+    def mean(self):
+        return self.total / len(self.samples) if self.samples else 0.0
+
+    def percentile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+    def summary(self):
+        return {
+            'count': len(self.samples),
+            'mean_ms': self.mean(),
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'max_ms': max(self.samples) if self.samples else 0.0,
+        }
+
+
+class Profiler:
+    def __init__(self, window=300, trace_capacity=50000, enabled=False):
+        self.enabled = enabled
+        self.window = window
+        self.histograms = {}  # phase -> RollingHistogram, in first seen order
+        self.pending = {}  # phase -> seconds added since the last flush
+        self.trace = deque(maxlen=trace_capacity)  # (phase, start s, duration s, thread name)
+        self.origin = perf_counter()
+        self.lock = threading.Lock()
+
+    def histogram(self, phase):
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = self.histograms[phase] = RollingHistogram(self.window)
+        return histogram
+
+    def record(self, phase, seconds, start=None):
+        ''' One whole sample for phase, traced too when start is given '''
+        with self.lock:
+            self.histogram(phase).add(seconds * 1000.0)
+            if start is not None:
+                self.trace.append((phase, start, seconds, threading.current_thread().name))
+
+    @contextmanager
+    def phase(self, name):
+        ''' Time the block as one sample of name '''
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - start, start)
+
+    def add(self, phase, seconds):
+        pending = self.pending
+        pending[phase] = pending.get(phase, 0.0) + seconds
+
+    def lap(self, phase, since):
+        ''' Add the time since since to phase, returns now for the next lap '''
+        now = perf_counter()
+        pending = self.pending
+        pending[phase] = pending.get(phase, 0.0) + (now - since)
+        return now
+
+    def flush(self):
+        ''' Turn the sums added since the last flush into one sample each (call once per tick) '''
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            for phase, seconds in pending.items():
+                self.histogram(phase).add(seconds * 1000.0)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.pending = {}
+            self.trace.clear()
+
+    def summary(self):
+        with self.lock:
+            return {phase: histogram.summary() for phase, histogram in self.histograms.items()}
+
+    # Export ---------------------------------------------------------------------------------------------------------------
+    def export_csv(self, path):
+        ''' One row per phase: summary stats, then the rolling bucket counts '''
+        bucket_names = [f'le_{edge}ms' for edge in BUCKETS_MS] + [f'gt_{BUCKETS_MS[-1]}ms']
+        with open(path, 'w', newline='') as out:
+            writer = csv.writer(out)
+            writer.writerow(['phase', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms'] + bucket_names)
+            with self.lock:
+                rows = [(phase, histogram.summary(), list(histogram.counts)) for phase, histogram in self.histograms.items()]
+            for phase, stats, counts in rows:
+                writer.writerow([phase, stats['count'], f"{stats['mean_ms']:.4f}", f"{stats['p50_ms']:.4f}",
+                                 f"{stats['p95_ms']:.4f}", f"{stats['max_ms']:.4f}"] + counts)
+
+    def export_chrome_trace(self, path):
+        threads = {}
+        events = []
+        with self.lock:
+            trace = list(self.trace)
+        for phase, start, seconds, thread in trace:
+            tid = threads.setdefault(thread, len(threads))
+            events.append({'name': phase, 'ph': 'X', 'pid': 0, 'tid': tid,
+                           'ts': (start - self.origin) * 1e6, 'dur': seconds * 1e6})
+        for thread, tid in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': tid, 'args': {'name': thread}})
+        with open(path, 'w') as out:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, out)
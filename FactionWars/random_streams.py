@@ -0,0 +1,46 @@
+''' Seeded random number streams owned by World.
+
+Each subsystem draws from its own random.Random, seeded from the world seed and the stream
+name. Adding draws to one subsystem (say, more food) then leaves the walls, spawns and
+wandering of a seeded run untouched, so runs stay comparable across changes.
+'''
+import random
+
+try:
+    import numpy as np
+except ImportError:  # Only numpy_generator needs it
+    np = None
+
+STREAMS = ('walls', 'spawn', 'food', 'velocity', 'wander')
+
+
+class RandomStreams:
+    def __init__(self, seed=None):
+        # Unseeded worlds still get a concrete seed (taken from the global random module, so
+        # random.seed() before building a World keeps working) and can be rebuilt from it
+        self.seed = random.getrandbits(64) if seed is None else seed
+        for name in STREAMS:
+            setattr(self, name, self.stream(name))
+
+    def stream(self, name):
+        ''' A new random.Random for name, the same sequence every time for the same seed '''
+        return random.Random(f'{self.seed}:{name}')
+
+    def numpy_generator(self, name):
+        ''' numpy Generator for vectorized code, seeded with the next draw from the name stream '''
+        return np.random.default_rng(getattr(self, name).getrandbits(64))
+
+
+class JitterBuffer:
+    ''' Uniform(-1, 1) numbers generated in bulk, two per agent per refill. An agent reads its pair
+    at values[2 * slot] and values[2 * slot + 1] instead of calling uniform twice. Always drawn from
+    the stdlib stream, with or without numpy, so a seed plays the same everywhere. '''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.values = []
+
+    def refill(self, count):
+        random_value = self.stream.random
+        self.values = [2.0 * random_value() - 1.0 for _ in range(2 * count)]
+        return self.values
@@ -0,0 +1,131 @@
+''' Sprite based drawing for World.render.
+
+Walls and king zone borders never move, so they are drawn once into a background surface
+that is blitted whole each frame. Agents and food are circles of a few fixed (color, radius)
+pairs, each pre-drawn once into a small sprite; a frame is then one Surface.blits call.
+
+With a fixed simulation step the frame usually lands between two ticks. capture() keeps
+the positions from before the last tick, and render(screen, alpha) draws everything
+alpha of the way from there to the current positions.
+'''
+import pygame
+
+COLORKEY = (255, 0, 255)
+
+
+class SpriteRenderer:
+    def __init__(self, world):
+        self.world = world
+        self.sprites = {}  # (color, radius) -> surface
+        self.background = None
+        self.previous = None  # Positions before the last tick, see capture
+
+    def invalidate(self):
+        ''' Rebuild the background next frame, for when walls or king zones change '''
+        self.background = None
+
+    def sprite(self, color, radius):
+        key = (color, radius)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            key_color = COLORKEY if tuple(color) != COLORKEY else (0, 0, 0)
+            sprite = pygame.Surface((radius * 2 + 1, radius * 2 + 1))
+            sprite.fill(key_color)
+            pygame.draw.circle(sprite, color, (radius, radius), radius)
+            sprite.set_colorkey(key_color, pygame.RLEACCEL)
+            if pygame.display.get_surface() is not None:
+                sprite = sprite.convert()
+            self.sprites[key] = sprite
+        return sprite
+
+    def build_background(self, size):
+        world = self.world
+        background = pygame.Surface(size)
+        background.fill((255, 255, 255))  # Bg white
+        world.draw_king_zones(background)
+        for wall in world.walls:
+            wall.render(background)
+        if pygame.display.get_surface() is not None:
+            background = background.convert()
+        return background
+
+    def capture(self):
+        ''' Remember current positions, call right before the World.update that alpha interpolates over '''
+        world = self.world
+        previous = {food: (food.position.x, food.position.y) for food in world.food}
+        for group in (world.group1, world.group2):
+            engine = group.engine
+            if engine is not None:
+                previous[group] = (list(engine.agents), engine.pos[:engine.count].copy())
+            else:
+                for agent in group.agents:
+                    previous[agent] = (agent.position.x, agent.position.y)
+        self.previous = previous
+
+    def engine_positions(self, group, alpha):
+        engine = group.engine
+        n = engine.count
+        pos = engine.pos[:n]
+        captured = self.previous.get(group) if self.previous is not None and alpha < 1 else None
+        if captured is None:
+            return pos
+        agents, before = captured
+        if len(agents) != n:
+            # Dead rows were compacted away since the capture, line the old rows up with the survivors
+            rows = {agent: row for row, agent in enumerate(agents)}
+            before = before[[rows[agent] for agent in engine.agents]]
+        return before + (pos - before) * alpha
+
+    def group_blits(self, group, blits, alpha=1.0):
+        sprites = self.sprites
+        engine = group.engine
+        if engine is not None:
+            # Positions straight from the engine arrays, no view objects,
+            # and every agent in a group shares the group color, so the sprite only depends on the radius
+            radii = engine.radius[:engine.count].astype(int)
+            corners = (self.engine_positions(group, alpha).astype(int) - radii[:, None]).tolist()
+            by_radius = {radius: self.sprite(group.color, radius) for radius in set(radii.tolist())}
+            blits.extend(zip(map(by_radius.__getitem__, radii.tolist()), corners))
+            return
+        previous = self.previous if alpha < 1 else None
+        for agent in group.agents:
+            radius = agent.radius
+            position = agent.position
+            x, y = position.x, position.y
+            if previous is not None:
+                px, py = previous.get(agent, (x, y))
+                x, y = px + (x - px) * alpha, py + (y - py) * alpha
+            sprite = sprites.get((agent.color, radius)) or self.sprite(agent.color, radius)
+            blits.append((sprite, (int(x) - radius, int(y) - radius)))
+
+    def render(self, screen, alpha=1.0):
+        ''' alpha: 0 draws the captured positions, 1 the current ones '''
+        world = self.world
+        if self.background is None or self.background.get_size() != screen.get_size():
+            self.background = self.build_background(screen.get_size())
+        screen.blit(self.background, (0, 0))
+
+        blits = []
+        previous = self.previous if alpha < 1 else None
+        for food in world.food:
+            radius = food.radius
+            x, y = food.position.x, food.position.y
+            if previous is not None:
+                px, py = previous.get(food, (x, y))
+                x, y = px + (x - px) * alpha, py + (y - py) * alpha
+            blits.append((self.sprite(food.color, radius), (int(x) - radius, int(y) - radius)))
+        self.group_blits(world.group1, blits, alpha)
+        self.group_blits(world.group2, blits, alpha)
+        screen.blits(blits, False)
+
+    def render_snapshot(self, screen, snapshot):
+        ''' Draw a simulation.Snapshot, for when the world is being updated on another thread '''
+        if self.background is None or self.background.get_size() != screen.get_size():
+            self.background = self.build_background(screen.get_size())
+        screen.blit(self.background, (0, 0))
+        sprites = self.sprites
+        blits = []
+        for color, radius, x, y in snapshot.items:
+            sprite = sprites.get((color, radius)) or self.sprite(color, radius)
+            blits.append((sprite, (int(x) - radius, int(y) - radius)))
+        screen.blits(blits, False)
@@ -0,0 +1,192 @@
+''' Binary match replays: the world parameters and seed, every player input, and periodic keyframes.
+
+A seeded World with a fixed delta_time and a fixed planner budget (PathPlanner.max_plans,
+not budget_ms) plays out the same way every time, so the inputs alone rebuild a match.
+Keyframes (see world_state.py) are there for seeking: Replay.seek restores the last keyframe
+before the wanted tick and steps headless from there, no rendering on the way.
+
+File layout, little endian, every record payload padded to 8 bytes:
+
+    b'FWREPLY1', u64 header length, JSON header (params, delta_time, keyframe_interval, max_plans)
+    records: u8 kind, 3 pad, u32 tick, u64 payload length, payload
+        INPUT     u8 input code, then the values ('<dd' x, y / '<BBd' group, weight, value / '<d' speed)
+        KEYFRAME  world_state.pack of the captured state
+        END       empty, tick is the last one recorded
+
+Keyframe sections are plain arrays in the file, Replay.keyframe hands them out as memoryviews
+over the mmap (np.frombuffer works on them too), nothing is copied until a restore.
+'''
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import json
+import math
+import mmap
+import struct
+import time
+from bisect import bisect_right
+from world import World
+from world_state import capture, restore, pack, unpack, padding, WEIGHTS
+
+MAGIC = b'FWREPLY1'
+LENGTH = struct.Struct('<Q')
+RECORD = struct.Struct('<B3xIQ')
+
+INPUT, KEYFRAME, END = 1, 2, 3
+INPUTS = ('attack', 'weight', 'max_speed')  # Input code is the index + 1
+INPUT_FORMATS = {'attack': struct.Struct('<dd'), 'weight': struct.Struct('<BBd'), 'max_speed': struct.Struct('<d')}
+
+
+class ReplayRecorder:
+    ''' Writes world's match to path from now on. World.update and World.apply_input call back into it. '''
+
+    def __init__(self, world, path, delta_time, keyframe_interval=300):
+        planner = world.path_planner
+        if planner.budget_ms is not None:
+            raise ValueError("Replays need a deterministic planner budget, use path_planner.max_plans instead of budget_ms")
+        self.world = world
+        self.keyframe_interval = keyframe_interval
+        self.file = open(path, 'wb')
+        header = json.dumps({'params': world.params, 'delta_time': delta_time,
+                             'keyframe_interval': keyframe_interval, 'max_plans': planner.max_plans}).encode()
+        self.file.write(MAGIC + LENGTH.pack(len(header)) + header + bytes(padding(len(header))))
+        self.write_keyframe()  # Whatever happened before recording started, playback starts here
+        world.recorder = self
+
+    def write(self, kind, payload):
+        self.file.write(RECORD.pack(kind, self.world.tick, len(payload) + padding(len(payload))))
+        self.file.write(payload)
+        self.file.write(bytes(padding(len(payload))))
+
+    def record_input(self, kind, args):
+        if kind == 'weight':
+            group_number, name, value = args
+            args = (group_number, WEIGHTS.index(name), value)
+        elif kind == 'max_speed' and args[0] is None:
+            args = (math.nan,)
+        self.write(INPUT, bytes((INPUTS.index(kind) + 1,)) + INPUT_FORMATS[kind].pack(*args))
+
+    def end_tick(self):
+        if self.world.tick % self.keyframe_interval == 0:
+            self.write_keyframe()
+
+    def write_keyframe(self):
+        self.write(KEYFRAME, pack(*capture(self.world)))
+
+    def close(self):
+        if self.file is None:
+            return
+        self.write(END, b'')
+        self.file.close()
+        self.file = None
+        self.world.recorder = None
+
+
+class Replay:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self.data
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a replay")
+        (length,) = LENGTH.unpack_from(data, len(MAGIC))
+        start = len(MAGIC) + LENGTH.size
+        header = json.loads(data[start:start + length])
+        self.params = header['params']
+        self.delta_time = header['delta_time']
+        self.keyframe_interval = header['keyframe_interval']
+        self.max_plans = header['max_plans']
+
+        self.inputs = {}  # tick -> [(kind, args)], applied before stepping on from that tick
+        self.keyframe_ticks = []
+        self.keyframe_spans = []  # (payload offset, length), same order
+        self.end_tick = 0
+        offset = start + length + padding(length)
+        while offset + RECORD.size <= len(data):
+            kind, tick, length = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            if offset + length > len(data):
+                break  # Cut off mid-record, eg. the recording game crashed
+            if kind == INPUT:
+                self.inputs.setdefault(tick, []).append(self.decode_input(offset))
+            elif kind == KEYFRAME:
+                self.keyframe_ticks.append(tick)
+                self.keyframe_spans.append((offset, length))
+            self.end_tick = max(self.end_tick, tick)
+            offset += length
+        if not self.keyframe_ticks:
+            raise ValueError(f"{path} has no keyframes")
+
+    def decode_input(self, offset):
+        kind = INPUTS[self.data[offset] - 1]
+        args = INPUT_FORMATS[kind].unpack_from(self.data, offset + 1)
+        if kind == 'weight':
+            args = (args[0], WEIGHTS[args[1]], args[2])
+        elif kind == 'max_speed' and math.isnan(args[0]):
+            args = (None,)
+        return kind, args
+
+    def keyframe(self, index):
+        ''' (arrays, meta) for world_state.restore, the arrays are memoryviews into the file '''
+        start, length = self.keyframe_spans[index]
+        return unpack(memoryview(self.data)[start:start + length])
+
+    def build_world(self):
+        params = self.params
+        world = World(params['width'], params['height'], engine=params['engine'], num_agents=params['num_agents'],
+                      cell_size=params['cell_size'], path_mode=params['path_mode'], seed=params['seed'])
+        world.path_planner.budget_ms = None
+        world.path_planner.max_plans = self.max_plans
+        return world
+
+    def step(self, world):
+        ''' Apply the inputs recorded at world.tick, then update once '''
+        for kind, args in self.inputs.get(world.tick, ()):
+            world.apply_input(kind, *args)
+        world.update(self.delta_time)
+
+    def seek(self, tick, world=None):
+        ''' World at tick, stepped on from the last keyframe at or before it. world, if given, must be
+        one this replay produced; it is restored in place, or just stepped on if it is already past
+        that keyframe and not beyond tick. Returns the world (a new one if none was given). '''
+        index = bisect_right(self.keyframe_ticks, tick) - 1
+        if index < 0:
+            raise ValueError(f"Replay starts at tick {self.keyframe_ticks[0]}, can't seek to {tick}")
+        if world is None or not self.keyframe_ticks[index] <= world.tick <= tick:
+            if world is None:
+                world = self.build_world()
+            restore(world, *self.keyframe(index))
+        while world.tick < tick:
+            self.step(world)
+        return world
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or play back a Faction Wars replay')
+    parser.add_argument('path')
+    parser.add_argument('--seek', type=int, default=None, help='Jump to this tick headless and print the state')
+    parser.add_argument('--play', action='store_true', help='Watch it (left/right arrows seek)')
+    args = parser.parse_args()
+
+    replay = Replay(args.path)
+    print(json.dumps({'params': replay.params, 'ticks': replay.end_tick, 'keyframes': len(replay.keyframe_ticks),
+                      'inputs': sum(len(inputs) for inputs in replay.inputs.values())}))
+    if args.seek is not None:
+        start = time.perf_counter()
+        world = replay.seek(args.seek)
+        elapsed = time.perf_counter() - start
+        print(json.dumps({'tick': world.tick, 'seek_seconds': elapsed,
+                          'survivors': [len(world.group1.agents), len(world.group2.agents)],
+                          'food_delivered': [world.group1.food_delivered, world.group2.food_delivered]}))
+    if args.play:
+        from game import Game
+        Game(replay=args.path).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+''' Runs World.update on a worker thread so the pygame loop only handles events and draws.
+
+After every tick the worker publishes a Snapshot, a plain copy of what the renderer needs
+(positions, radii, colors, group sizes). The worker builds the next snapshot while the main
+thread draws the published one, and publishing is a single reference swap, so neither side
+waits on the other. The main thread never touches the world directly: UI input goes through
+submit(), and the queued commands run on the worker between ticks.
+'''
+import queue
+import threading
+import time
+
+
+class Snapshot:
+    def __init__(self, tick, items, counts):
+        self.tick = tick
+        self.items = items  # list of (color, radius, x, y), food first, then group1, group2
+        self.counts = counts  # (len(group1.agents), len(group2.agents))
+
+
+def take_snapshot(world):
+    items = [(food.color, food.radius, food.position.x, food.position.y) for food in world.food]
+    for group in (world.group1, world.group2):
+        engine = group.engine
+        if engine is not None:
+            n = engine.count
+            radii = engine.radius[:n].astype(int).tolist()
+            items.extend((group.color, radius, x, y) for radius, (x, y) in zip(radii, engine.pos[:n].tolist()))
+        else:
+            items.extend((agent.color, agent.radius, agent.position.x, agent.position.y) for agent in group.agents)
+    return Snapshot(world.tick, items, (len(world.group1.agents), len(world.group2.agents)))
+
+
+class SimulationThread(threading.Thread):
+    def __init__(self, world, delta_time, sim_rate=None):
+        super().__init__(name='simulation', daemon=True)
+        self.world = world
+        self.delta_time = delta_time
+        self.sim_rate = sim_rate  # Ticks per second, None runs as fast as it can
+        self.commands = queue.SimpleQueue()
+        self.snapshot = take_snapshot(world)
+        self.running = False
+        self.ticks_per_second = 0.0
+
+    def submit(self, command):
+        ''' Queue command(world) to run on the simulation thread before the next tick '''
+        self.commands.put(command)
+
+    def latest(self):
+        return self.snapshot
+
+    def stop(self):
+        self.running = False
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        self.running = True
+        world = self.world
+        interval = None if not self.sim_rate else 1.0 / self.sim_rate
+        next_tick = time.perf_counter()
+        rate_start, rate_ticks = next_tick, 0
+        while self.running:
+            while True:
+                try:
+                    command = self.commands.get_nowait()
+                except queue.Empty:
+                    break
+                command(world)
+
+            world.update(self.delta_time)
+            self.snapshot = take_snapshot(world)
+
+            now = time.perf_counter()
+            rate_ticks += 1
+            if now - rate_start >= 1.0:
+                self.ticks_per_second = rate_ticks / (now - rate_start)
+                rate_start, rate_ticks = now, 0
+            if interval is not None:
+                next_tick += interval
+                if next_tick > now:
+                    time.sleep(next_tick - now)
+                else:
+                    next_tick = now  # Behind, don't try to catch up
+            else:
+                time.sleep(0)  # Let the render thread in
@@ -0,0 +1,102 @@
+''' Uniform bucketed hash grid for fast radius queries (neighbours, enemies, ...) '''
+from math import floor
+
+
+class SpatialHash:
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.buckets = {}  # (cx, cy) -> list of items
+        self.cells = {}  # item -> (cx, cy) it is currently bucketed in
+
+    def cell_of(self, x, y):
+        size = self.cell_size
+        return (floor(x / size), floor(y / size))
+
+    def clear(self):
+        self.buckets.clear()
+        self.cells.clear()
+
+    def insert(self, item, position):
+        cell = self.cell_of(position.x, position.y)
+        self.cells[item] = cell
+        bucket = self.buckets.get(cell)
+        if bucket is None:
+            self.buckets[cell] = [item]
+        else:
+            bucket.append(item)
+
+    def remove(self, item):
+        cell = self.cells.pop(item, None)
+        if cell is None:
+            return
+        bucket = self.buckets[cell]
+        bucket.remove(item)  # Buckets are small, so this is cheap
+        if not bucket:
+            del self.buckets[cell]
+
+    def move(self, item, position):
+        ''' Re-bucket item only if it has crossed into another cell '''
+        cell = self.cell_of(position.x, position.y)
+        old_cell = self.cells.get(item)
+        if cell == old_cell:
+            return
+        if old_cell is not None:
+            self.remove(item)
+        self.cells[item] = cell
+        bucket = self.buckets.get(cell)
+        if bucket is None:
+            self.buckets[cell] = [item]
+        else:
+            bucket.append(item)
+
+    def rebuild(self, items):
+        self.clear()
+        for item in items:
+            self.insert(item, item.position)
+
+    def move_cells(self, items, cells):
+        ''' move() for many items, with their cells already worked out (cells[i] is items[i]'s (cx, cy)) '''
+        buckets, current = self.buckets, self.cells
+        for item, cell in zip(items, cells):
+            old_cell = current.get(item)
+            if cell == old_cell:
+                continue
+            if old_cell is not None:
+                self.remove(item)
+            current[item] = cell
+            bucket = buckets.get(cell)
+            if bucket is None:
+                buckets[cell] = [item]
+            else:
+                bucket.append(item)
+
+    def rebuild_cells(self, items, cells):
+        ''' rebuild() with the cells already worked out, like move_cells '''
+        self.clear()
+        self.cells.update(zip(items, cells))
+        buckets = self.buckets
+        for item, cell in zip(items, cells):
+            bucket = buckets.get(cell)
+            if bucket is None:
+                buckets[cell] = [item]
+            else:
+                bucket.append(item)
+
+    def query(self, position, radius):
+        ''' Return every item in the cells overlapped by the circle. Callers do the exact distance test. '''
+        size = self.cell_size
+        min_x = floor((position.x - radius) / size)
+        max_x = floor((position.x + radius) / size)
+        min_y = floor((position.y - radius) / size)
+        max_y = floor((position.y + radius) / size)
+        buckets = self.buckets
+        found = []
+        for cx in range(min_x, max_x + 1):
+            for cy in range(min_y, max_y + 1):
+                bucket = buckets.get((cx, cy))
+                if bucket:
+                    found.extend(bucket)
+        return found
+
+    def __len__(self):
+        return len(self.cells)
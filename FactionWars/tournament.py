@@ -0,0 +1,133 @@
+''' Monte Carlo tournament runner. Plays many independent seeded headless matches across all
+CPU cores, sweeping group1's behaviour weights and the group sizes against group2's defaults,
+and streams one CSV row per match to disk as soon as it finishes. Every match starts with both
+groups ordered to attack a point near the middle of the map, so they meet and fight.
+'''
+import argparse
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from flow_field import FlowField
+from headless import run_match, DEFAULT_DELTA_TIME
+from vector2d import Vector2D
+
+COLUMNS = [
+    'match', 'seed', 'num_agents', 'cohesion', 'separation', 'alignment',
+    'survivors1', 'survivors2', 'food1', 'food2', 'ticks', 'ticks_to_extinction', 'elapsed',
+]
+
+
+def make_matches(weight_values, group_sizes, repeats, base_seed=0):
+    ''' One match config per (size, cohesion, separation, alignment, repeat). The seed comes from the
+    repeat alone, so every configuration plays the same maps and spawns and only the weights differ.
+    The wander weight is not swept, steering always uses agent.WANDER_WEIGHT whatever the group's is. '''
+    matches = []
+    grid = itertools.product(group_sizes, weight_values, weight_values, weight_values, range(repeats))
+    for match, (size, cohesion, separation, alignment, repeat) in enumerate(grid):
+        matches.append({
+            'match': match,
+            'seed': base_seed + repeat,
+            'num_agents': size,
+            'weights': (cohesion, separation, alignment),
+        })
+    return matches
+
+
+def match_key(num_agents, cohesion, separation, alignment, seed):
+    ''' What identifies a match across runs, match numbers shift when --values, --sizes or --repeats change '''
+    return int(num_agents), float(cohesion), float(separation), float(alignment), int(seed)
+
+
+def meeting_point(world):
+    ''' The free cell nearest the middle of the map that both king zones can reach, in world space.
+    The walls are random, so the middle itself can be cut off from one side. '''
+    fields = []
+    for group in (world.group1, world.group2):
+        x, y, width, height = group.king_zone
+        fields.append(FlowField(world, world.world_to_grid(Vector2D(x + width / 2, y + height / 2))))
+    middle_x, middle_y = world.world_to_grid(Vector2D(world.width / 2, world.height / 2))
+    cells = sorted(itertools.product(range(world.grid_width), range(world.grid_height)),
+                   key=lambda cell: (cell[0] - middle_x) ** 2 + (cell[1] - middle_y) ** 2)
+    for cell in cells:
+        if world.grid[cell[0]][cell[1]] == 0 and all(field.distance(cell) is not None for field in fields):
+            return world.grid_to_world(cell)
+    return Vector2D(world.width / 2, world.height / 2)  # The zones are walled off from each other
+
+
+def setup_match(world, weights):
+    ''' group1 gets the swept weights, then both groups are ordered to attack the same point so they meet and fight '''
+    world.group1.apply_behavior_weights(*weights, world.group1.wander_weight)
+    target = meeting_point(world)
+    world.apply_input('attack', target.x, target.y)
+
+
+def play(config, ticks, delta_time, engine):
+    ''' Worker entry point, runs in a child process '''
+    weights = config['weights']
+    stats = run_match(ticks, delta_time, config['seed'], num_agents=config['num_agents'], engine=engine,
+                      setup=lambda world: setup_match(world, weights))
+    return {
+        'match': config['match'],
+        'seed': config['seed'],
+        'num_agents': config['num_agents'],
+        'cohesion': weights[0],
+        'separation': weights[1],
+        'alignment': weights[2],
+        'survivors1': stats['survivors']['group1'],
+        'survivors2': stats['survivors']['group2'],
+        'food1': stats['food_delivered']['group1'],
+        'food2': stats['food_delivered']['group2'],
+        'ticks': stats['ticks'],
+        'ticks_to_extinction': stats['ticks_to_extinction'],
+        'elapsed': round(stats['elapsed'], 4),
+    }
+
+
+def run_tournament(matches, out_path, ticks=2000, delta_time=DEFAULT_DELTA_TIME, engine=None, workers=None):
+    ''' Play every match on a process pool, appending each result row to out_path as it completes.
+    Matches already in out_path (same size, weights and seed) are skipped, so an interrupted sweep can be
+    resumed, or extended with more values or repeats.
+    '''
+    done = set()
+    if os.path.exists(out_path):
+        with open(out_path, newline='') as f:
+            done = {match_key(row['num_agents'], row['cohesion'], row['separation'], row['alignment'], row['seed'])
+                    for row in csv.DictReader(f)}
+    todo = [config for config in matches
+            if match_key(config['num_agents'], *config['weights'], config['seed']) not in done]
+
+    new_file = not os.path.exists(out_path) or os.path.getsize(out_path) == 0
+    with open(out_path, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        if new_file:
+            writer.writeheader()
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = [pool.submit(play, config, ticks, delta_time, engine) for config in todo]
+            for finished, future in enumerate(as_completed(futures), 1):
+                writer.writerow(future.result())
+                f.flush()
+                print(f"{finished}/{len(todo)} matches", end='\r', flush=True)
+    print()
+    return len(todo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep behaviour weights and group sizes over many headless matches')
+    parser.add_argument('--out', default='tournament.csv')
+    parser.add_argument('--values', type=float, nargs='+', default=[0.1, 0.5, 1.0], help='Values tried for each weight')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[200], help='Agents per group')
+    parser.add_argument('--repeats', type=int, default=1, help='Seeded matches per configuration')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the first repeat, each repeat plays its own map')
+    parser.add_argument('--ticks', type=int, default=2000)
+    parser.add_argument('--delta-time', type=float, default=DEFAULT_DELTA_TIME)
+    parser.add_argument('--engine', choices=['array'], default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    matches = make_matches(args.values, args.sizes, args.repeats, args.seed)
+    run_tournament(matches, args.out, args.ticks, args.delta_time, args.engine, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -130,6 +130,64 @@ class Vector2D(object):
         ''' Simple copy Vector2D with self values '''
         return Vector2D(self.x, self.y)
 
+    # In-place and out-parameter versions of the operators, for hot loops that shouldn't allocate.
+    # Each returns the vector it wrote to, so calls can be chained.
+    def set(self, x, y):
+        ''' set x and y in place '''
+        self.x = x
+        self.y = y
+        return self
+
+    def set_from(self, v):
+        ''' copy v's values into self '''
+        self.x = v.x
+        self.y = v.y
+        return self
+
+    def add_scaled(self, v, scale):
+        ''' self += v * scale, without the temporary '''
+        self.x += v.x * scale
+        self.y += v.y * scale
+        return self
+
+    def add_into(self, rhs, out):
+        ''' out = self + rhs '''
+        out.x = self.x + rhs.x
+        out.y = self.y + rhs.y
+        return out
+
+    def sub_into(self, rhs, out):
+        ''' out = self - rhs '''
+        out.x = self.x - rhs.x
+        out.y = self.y - rhs.y
+        return out
+
+    def scale_into(self, scale, out):
+        ''' out = self * scale '''
+        out.x = self.x * scale
+        out.y = self.y * scale
+        return out
+
+    def normalised_into(self, out):
+        ''' out = normalised copy of self (zero stays zero) '''
+        x = self.x
+        y = self.y
+        l = sqrt(x*x + y*y)
+        if l > 0:
+            out.x = x/l
+            out.y = y/l
+        else:
+            out.x = 0.
+            out.y = 0.
+        return out
+
+    def perp_into(self, out):
+        ''' out = vector perpendicular to self, same as perp() '''
+        x = self.x
+        out.x = -self.y
+        out.y = x
+        return out
+
     def __iadd__(self, rhs):  # +=
         self.x += rhs.x
         self.y += rhs.y
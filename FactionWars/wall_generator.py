@@ -1,6 +1,5 @@
 ''' Generate interesting walls for the simulation '''
 import pygame
-import random
 
 class WallGenerator:
     def __init__(self, world, wall_thickness=20):
@@ -22,13 +21,14 @@ class WallGenerator:
     def generate_walls(self): # Meh
             walls = []
             num_walls = 40  
+            rng = self.world.rng.walls
 
             for _ in range(num_walls):
                 while True:
-                    x = random.randint(0, self.width - self.wall_thickness)
-                    y = random.randint(0, self.height - self.wall_thickness)
-                    wall_width = random.randint(self.wall_thickness, self.width // 4)
-                    wall_height = random.randint(self.wall_thickness, self.height // 4)
+                    x = rng.randint(0, self.width - self.wall_thickness)
+                    y = rng.randint(0, self.height - self.wall_thickness)
+                    wall_width = rng.randint(self.wall_thickness, self.width // 4)
+                    wall_height = rng.randint(self.wall_thickness, self.height // 4)
 
                     # Check if the wall overlaps
                     if self.is_valid_wall_position(x, y, wall_width, wall_height):
@@ -0,0 +1,32 @@
+''' Static broad-phase for wall checks. Built once in World, maps each path grid cell to the
+walls that come within margin of it, so collision checks only test the walls nearby.
+'''
+
+
+class WallIndex:
+    def __init__(self, walls, cell_size, margin=10):
+        self.walls = walls
+        self.cell_size = cell_size
+        self.margin = margin  # Largest agent radius, walls closer than this to a cell are listed in it
+        self.cells = {}  # (cx, cy) -> walls in their original order
+        for wall in walls:
+            rect = wall.rect
+            min_x = (rect.left - margin) // cell_size
+            max_x = (rect.right + margin) // cell_size
+            min_y = (rect.top - margin) // cell_size
+            max_y = (rect.bottom + margin) // cell_size
+            for cx in range(min_x, max_x + 1):
+                for cy in range(min_y, max_y + 1):
+                    self.cells.setdefault((cx, cy), []).append(wall)
+
+    def near(self, position):
+        ''' Walls that may touch a circle of radius <= margin centred on position '''
+        size = self.cell_size
+        return self.cells.get((int(position.x // size), int(position.y // size)), ())
+
+    def point_in_wall(self, x, y):
+        size = self.cell_size
+        for wall in self.cells.get((int(x // size), int(y // size)), ()):
+            if wall.rect.collidepoint(x, y):
+                return True
+        return False
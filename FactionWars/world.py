@@ -1,15 +1,33 @@
 import pygame
+from time import perf_counter
 from agent_group import AgentGroup
-from matrix33 import Matrix33
 from food import Food
-from wall_generator import WallGenerator
-from astar import a_star_search 
+from wall_generator import WallGenerator, Wall
+from astar import a_star_search, GridMap
 from vector2d import Vector2D
+from spatial_hash import SpatialHash
+from flow_field import FlowFieldCache
+from path_planner import PathPlanner, PathStats
+from hpa import HierarchicalPlanner
+from wall_index import WallIndex
+from renderer import SpriteRenderer
+from random_streams import RandomStreams
+from profiler import Profiler
+from combat_log import CombatLog
+import world_state
 
 class World:
-    def __init__(self, width, height):
+    def __init__(self, width, height, engine=None, num_agents=200, cell_size=30, path_mode=None, seed=None, walls=None):
         self.width = width
         self.height = height
+        self.tick = 0  # Number of update steps so far
+        self.rng = RandomStreams(seed)  # Per-subsystem seeded streams, self.rng.seed rebuilds the same world
+        self.seed = self.rng.seed
+        self.profiler = Profiler()  # Off until enabled, eg. by the Game overlay
+        self.combat_log = CombatLog(self)  # Level OFF, see combat_log.py
+        self.recorder = None  # ReplayRecorder writing this match, see replay.py
+        self.agents_by_id = {}  # Agent.id -> agent, only while it is alive and in its group
+        self.next_agent_id = 0
         
         # Define start zones in the corners
         self.start_zone_size = min(width, height) // 5
@@ -18,32 +36,117 @@ class World:
         self.kzone1 = (0, 0, start_zone_size, start_zone_size)
         self.kzone2 = (width - start_zone_size, height - start_zone_size, start_zone_size, start_zone_size)
         
-        # Add walls
-        self.walls = WallGenerator(self).generate
+        # Add walls, or the (x, y, width, height) rects given, eg. by from_snapshot
+        if walls is None:
+            self.walls = WallGenerator(self).generate
+        else:
+            self.walls = [Wall(self, (x, y), wall_width, wall_height) for x, y, wall_width, wall_height in walls]
+
+        # Grid overlay for path planning, rounded up so cells cover the whole world
+        self.cell_size = cell_size
+        self.grid_width = -(-width // self.cell_size)
+        self.grid_height = -(-height // self.cell_size)
+        self.grid = [[0 for _ in range(self.grid_height)] for _ in range(self.grid_width)]
+        self.initialize_grid()
+
+        # Broad-phase so wall checks only look at walls near a point, agents are at most 10 in radius
+        self.wall_index = WallIndex(self.walls, self.cell_size, margin=10)
         
         # Add two groups of agents, lags around 500 each
         # AGENT GROUP CONSTRUCTOR cohesion_weight, separation_weight, alignment_weight, wander_weight
-        self.group1 = AgentGroup(self, 200, (255, 0, 0), 0.1, 0.5, 0.4, 0.8, self.kzone1)
-        self.group2 = AgentGroup(self, 200, (0, 0, 255), 0.3, 1.0, 0.3, 1.0, self.kzone2)
+        # engine='array' keeps each group's agent state in NumPy arrays (see array_engine.py)
+        self.group1 = AgentGroup(self, num_agents, (255, 0, 0), 0.1, 0.5, 0.4, 0.8, self.kzone1, engine=engine)
+        self.group2 = AgentGroup(self, num_agents, (0, 0, 255), 0.3, 1.0, 0.3, 1.0, self.kzone2, engine=engine)
+
+        # Spatial index per faction for neighbour/enemy queries, kept up to date by AgentGroup.update
+        self.neighbor_radius = 15  # Largest radius agents query with
+        self.agent_grids = {}
+        for group in (self.group1, self.group2):
+            grid = SpatialHash(self.neighbor_radius)
+            grid.rebuild(group.agents)
+            self.agent_grids[group] = grid
         
-        # Add Food
+        # Add Food, bucketed by position so agents only test the food next to them
+        self.food_grid = SpatialHash(self.neighbor_radius)
         self.num_food = 30
         self.food = [Food(self) for _ in range(self.num_food)]
+        self.max_food_radius = max((food.radius for food in self.food), default=0)
         
-        # Grid overlay for path planning 
-        self.cell_size = 30 # Some values break it...
-        self.grid_width = width // self.cell_size
-        self.grid_height = height // self.cell_size
-        self.grid = [[0 for _ in range(self.grid_height)] for _ in range(self.grid_width)]
-        self.initialize_grid()
+
+        # 'flow': walls are static, so paths to a shared goal come from a cached flow field rather than a fresh A*
+        # 'hpa': hierarchical planner, for big grids where a whole-grid BFS per goal is too slow
+        # 'astar': flat array A* per request
+        if path_mode is None:
+            path_mode = 'hpa' if self.grid_width * self.grid_height > 40000 else 'flow'
+        self.path_mode = path_mode
+        self.flow_fields = FlowFieldCache(self)
+        self.grid_map = GridMap(self.grid) if path_mode == 'astar' else None
+        self.hierarchical = HierarchicalPlanner(self) if path_mode == 'hpa' else None
+        self.path_planner = PathPlanner(self)  # Agents queue their path requests here
+        # Enough to build this world again, eg. for a replay
+        self.params = {'width': width, 'height': height, 'engine': engine, 'num_agents': num_agents,
+                       'cell_size': cell_size, 'path_mode': path_mode, 'seed': self.seed}
+        self.path_stats = PathStats(self)  # Sample with path_stats.sample()
+        self.renderer = SpriteRenderer(self)
         
     def update(self, delta_time):
-        self.group1.update(delta_time)
-        self.group2.update(delta_time)
-        for food in self.food:
-            food.update()
+        self.tick += 1
+        profiler = self.profiler
+        with profiler.phase('tick'):
+            self.path_stats.begin_tick()
+            self.path_planner.begin_frame()
+            with profiler.phase('group1'):
+                self.group1.update(delta_time)
+            with profiler.phase('group2'):
+                self.group2.update(delta_time)
+            with profiler.phase('food'):
+                for food in self.food:
+                    food.update()
+        if profiler.enabled:
+            profiler.flush()  # Per-agent sub-phases (neighbors, state_machine, ...) become one sample per tick
+        self.combat_log.end_tick()
+        if self.recorder is not None:
+            self.recorder.end_tick()
 
-    def render(self, screen):
+    def apply_input(self, kind, *args):
+        ''' Player input: ('attack', x, y), ('weight', group number, weight name, value) or ('max_speed', value).
+        The UI goes through here rather than straight to the groups so a replay can record it '''
+        if self.recorder is not None:
+            self.recorder.record_input(kind, args)
+        if kind == 'attack':
+            target = Vector2D(*args)
+            self.group1.world_target = target
+            self.group2.world_target = target
+            self.group1.attack()
+            self.group2.attack()
+        elif kind == 'weight':
+            group_number, name, value = args
+            setattr(self.get_group(group_number), name, value)
+        elif kind == 'max_speed':
+            self.group1.set_max_speed(args[0])
+            self.group2.set_max_speed(args[0])
+        else:
+            raise ValueError(f"Unknown input: {kind}")
+
+    # Checkpoints
+    def snapshot(self):
+        ''' Everything needed to carry on from this tick as bytes, walls and grid included (see world_state.py) '''
+        return world_state.snapshot(self)
+
+    def restore(self, data):
+        ''' Go back to a snapshot of this world, or of any other world on the same map with the same engine '''
+        world_state.restore_snapshot(self, *world_state.read_snapshot(data))
+
+    @classmethod
+    def from_snapshot(cls, data):
+        ''' A new World in the snapshot's state, eg. one of many branches forked from the same tick '''
+        return world_state.load(cls, data)
+
+    def render(self, screen, alpha=1.0):
+        self.renderer.render(screen, alpha)
+
+    def render_direct(self, screen):
+        ''' Draw everything with one draw call each, as before the sprite renderer '''
         screen.fill((255, 255, 255))  # Bg white
         self.draw_king_zones(screen)
         for wall in self.walls:
@@ -52,7 +155,7 @@ class World:
             food.render(screen)
         self.group1.render(screen)
         self.group2.render(screen)
-        
+
     def draw_king_zones(self, screen):
         x, y, width, height = self.kzone1
         pygame.draw.rect(screen, (255, 0, 0), (x, y, width, height), 2)
@@ -60,9 +163,31 @@ class World:
         x, y, width, height = self.kzone2
         pygame.draw.rect(screen, (0, 0, 255), (x, y, width, height), 2)
 
+    def register_agent(self, agent):
+        ''' Hand out a stable id. References between objects (Agent.enemy, Food.being_held_by) are kept
+        as ids and looked up here, so they turn into None once the agent is removed '''
+        agent_id = self.next_agent_id
+        self.next_agent_id += 1
+        self.agents_by_id[agent_id] = agent
+        return agent_id
+
+    def unregister_agent(self, agent):
+        self.agents_by_id.pop(agent.id, None)
+
+    def get_agent(self, agent_id):
+        return self.agents_by_id.get(agent_id)
+
     def get_all_agents(self):
         return self.group1.agents + self.group2.agents
 
+    def get_group(self, group_number):
+        if group_number == 1:
+            return self.group1
+        elif group_number == 2:
+            return self.group2
+        else:
+            return None
+
     def get_group_agents(self, group_number): # Get own faction agents
         if group_number == 1:
             return self.group1.agents
@@ -71,22 +196,56 @@ class World:
         else:
             return []
 
-    def get_other_group_agents(self, group): # Get other faction agents
+    def get_other_group(self, group):
         if group == self.group1:
-            return self.group2.agents
+            return self.group2
         elif group == self.group2:
-            return self.group1.agents
+            return self.group1
         else:
+            return None
+
+    def get_other_group_agents(self, group): # Get other faction agents
+        other = self.get_other_group(group)
+        if other is None:
             return []
+        return other.agents
+
+    def get_agents_in_radius(self, position, radius, group=None, mode='all'):
+        ''' Agents within radius of position. mode is 'same' (group's faction), 'enemy' (other faction) or 'all' '''
+        if mode == 'same':
+            grids = [self.agent_grids[group]]
+        elif mode == 'enemy':
+            grids = [grid for g, grid in self.agent_grids.items() if g != group]
+        else:
+            grids = self.agent_grids.values()
+
+        px, py = position.x, position.y
+        radius_sq = radius * radius
+        found = []
+        for grid in grids:
+            for agent in grid.query(position, radius):
+                dx = agent.position.x - px
+                dy = agent.position.y - py
+                if dx * dx + dy * dy <= radius_sq:
+                    found.append(agent)
+        return found
 
     def transform_points(self, points, pos, forward, side, scale):
-        wld_pts = [pt.copy() for pt in points]
-        mat = Matrix33()
-        mat.scale_update(scale.x, scale.y)
-        mat.rotate_by_vectors_update(forward, side)
-        mat.translate_update(pos.x, pos.y)
-        mat.transform_vector2d_list(wld_pts)
-        return wld_pts
+        ''' Local to world for a list of points, returns new Vector2Ds. Same as building a Matrix33 with
+        scale, rotate_by_vectors and translate, worked out directly '''
+        sfx, sfy = scale.x * forward.x, scale.x * forward.y
+        ssx, ssy = scale.y * side.x, scale.y * side.y
+        px, py = pos.x, pos.y
+        return [Vector2D(sfx * pt.x + ssx * pt.y + px, sfy * pt.x + ssy * pt.y + py) for pt in points]
+
+    def transform_point(self, point, pos, forward, side, scale, out=None):
+        ''' Local to world for a single point, written to out (can be point itself) or a new Vector2D '''
+        if out is None:
+            out = Vector2D()
+        x, y = point.x, point.y
+        out.x = scale.x * forward.x * x + scale.y * side.x * y + pos.x
+        out.y = scale.x * forward.y * x + scale.y * side.y * y + pos.y
+        return out
 
     # Grid and planning stuff
     def initialize_grid(self):
@@ -101,6 +260,16 @@ class World:
                 for y in range(start_grid_y, end_grid_y + 1):
                     self.grid[x][y] = 1  # Marking grid cells as occupied by walls
             
+    def grid_changed(self):
+        ''' Rebuild what was derived from self.grid after it was edited '''
+        counters = self.path_stats.backend_counters()
+        self.flow_fields.clear()
+        if self.grid_map is not None:
+            self.grid_map = GridMap(self.grid)
+        if self.hierarchical is not None:
+            self.hierarchical = HierarchicalPlanner(self)
+        self.path_stats.backend_replaced(counters)
+
     def get_neighbors(self, state):
         grid_x, grid_y = state
         neighbors = []
@@ -117,15 +286,32 @@ class World:
     def heuristic(self, state, goal): # Manhattan
         return abs(state[0] - goal[0]) + abs(state[1] - goal[1])
     
+    def world_to_grid(self, position):
+        # Clamped, positions on the far edge (x == width) still land in the last cell
+        x = min(max(int(position.x) // self.cell_size, 0), self.grid_width - 1)
+        y = min(max(int(position.y) // self.cell_size, 0), self.grid_height - 1)
+        return (x, y)
+
+    def grid_to_world(self, cell):
+        x, y = cell
+        return Vector2D(x * self.cell_size + self.cell_size // 2, y * self.cell_size + self.cell_size // 2)
+
     def plan_path(self, start, goal):
-        start_grid = (int(start.x) // self.cell_size, int(start.y) // self.cell_size)
-        goal_grid = (int(goal.x) // self.cell_size, int(goal.y) // self.cell_size)
+        started = perf_counter()
+        start_grid = self.world_to_grid(start)
+        goal_grid = self.world_to_grid(goal)
 
-        result_node, _ = a_star_search(start_grid, goal_grid, self.get_neighbors, self.step_cost, self.heuristic)
+        expanded = 0  # Flow fields and HPA count their own, see PathStats.backend_counters
+        if self.path_mode == 'flow':
+            cells = self.flow_fields.get(goal_grid).path(start_grid)
+        elif self.path_mode == 'hpa':
+            cells = self.hierarchical.find_path(start_grid, goal_grid)
+        else:
+            result_node, expanded = a_star_search(start_grid, goal_grid, self.get_neighbors, self.step_cost, self.heuristic, grid=self.grid_map)
+            cells = result_node.path() if result_node is not None else []
 
-        if result_node is None:
+        self.path_stats.planned(perf_counter() - started, bool(cells), expanded)
+        if not cells:
             return []  # No path found
 
-        # Reconstruct path
-        path = result_node.path()
-        return [Vector2D(x * self.cell_size + self.cell_size // 2, y * self.cell_size + self.cell_size // 2) for x, y in path]
+        return [self.grid_to_world(cell) for cell in cells]
@@ -0,0 +1,360 @@
+''' The part of a World that changes while a match runs, as flat arrays plus a small JSON-able dict.
+
+capture() takes the agents (in group order, which is also update order), food, the order
+items sit in the spatial hash buckets, pending path requests and the random streams.
+Walls, the path grid and everything else fixed at construction are left out, so restore()
+needs a World built with the same parameters and seed. It then puts that World in exactly
+the captured state, and stepping on from there matches the original run tick for tick.
+
+References between objects are stored as agent ids and indices into World.food.
+Arrays are array.array ('q' ints, 'b' flags, 'd' floats, vectors as x, y pairs, NaN for
+None); restore() takes any sequences, eg. memoryviews straight out of a replay file.
+
+snapshot() adds the walls, path grid and World parameters, so load() can rebuild a World
+with nothing else to go on (see World.snapshot and World.from_snapshot).
+
+pack() lays the arrays out as one buffer, little endian:
+    u32 section count, u32 pad, sections of (24s name, c typecode, 7 pad, u64 offset, u64 count),
+    then the data, each section 8 byte aligned. 'meta' holds the JSON part.
+'''
+import json
+import math
+import struct
+from array import array
+from collections import OrderedDict
+from agent import Agent, KingAgent, MODES, MODE_CODES
+from food import Food
+from path_planner import PathRequest
+from random_streams import STREAMS
+from vector2d import Vector2D
+
+NONE = -1  # Missing agent id or food index
+WEIGHTS = ('cohesion_weight', 'separation_weight', 'alignment_weight', 'wander_weight')
+SNAPSHOT_MAGIC = b'FWSNAP01'
+COMPATIBLE_PARAMS = ('engine', 'width', 'height', 'cell_size')  # restore_snapshot needs these to match
+SECTION_COUNT = struct.Struct('<I4x')
+SECTION = struct.Struct('<24sc7xQQ')
+
+
+def padding(length):
+    return -length % 8
+
+
+def pack(arrays, meta):
+    sections = [(name.encode(), values.typecode.encode(), values.tobytes(), len(values))
+                for name, values in arrays.items()]
+    meta = json.dumps(meta).encode()
+    sections.append((b'meta', b'B', meta, len(meta)))
+
+    offset = SECTION_COUNT.size + SECTION.size * len(sections)
+    table, blobs = [SECTION_COUNT.pack(len(sections))], []
+    for name, typecode, data, count in sections:
+        table.append(SECTION.pack(name, typecode, offset, count))
+        blobs.append(data + bytes(padding(len(data))))
+        offset += len(blobs[-1])
+    return b''.join(table + blobs)
+
+
+def unpack(buffer):
+    ''' (arrays, meta) from pack's output, the arrays are memoryviews into buffer '''
+    view = memoryview(buffer)
+    (count,) = SECTION_COUNT.unpack_from(view)
+    arrays = {}
+    for index in range(count):
+        name, typecode, offset, length = SECTION.unpack_from(view, SECTION_COUNT.size + index * SECTION.size)
+        typecode = typecode.decode()
+        size = struct.calcsize(typecode) * length
+        arrays[name.rstrip(b'\0').decode()] = view[offset:offset + size].cast(typecode)
+    meta = json.loads(bytes(arrays.pop('meta')))
+    return arrays, meta
+
+
+def add_vector(values, vector):
+    if vector is None:
+        values.extend((math.nan, math.nan))
+    else:
+        values.extend((vector.x, vector.y))
+
+
+def get_vector(values, index):
+    x = values[2 * index]
+    return None if math.isnan(x) else Vector2D(x, values[2 * index + 1])
+
+
+def grid_order(grid, key):
+    ''' Bucket cells and items in bucket order. Neighbour lists come out of the buckets in that
+    order and the flocking sums follow it, so it has to survive a restore '''
+    cells, items = array('q'), array('q')
+    for cell, bucket in grid.buckets.items():
+        for item in bucket:
+            cells.extend(cell)
+            items.append(key(item))
+    return cells, items
+
+
+def restore_grid(grid, cells, items, lookup):
+    grid.clear()
+    buckets = grid.buckets
+    for index, key in enumerate(items):
+        cell = (cells[2 * index], cells[2 * index + 1])
+        item = lookup(key)
+        grid.cells[item] = cell
+        bucket = buckets.get(cell)
+        if bucket is None:
+            buckets[cell] = [item]
+        else:
+            bucket.append(item)
+
+
+def capture(world):
+    ''' Returns (arrays, meta): name -> array.array, and a dict of plain values '''
+    arrays = {}
+    request_index = {}  # PathRequest -> index in meta['requests'], requests shared by agents stay shared
+    requests = []
+
+    def add_request(request):
+        if request is None:
+            return NONE
+        index = request_index.get(request)
+        if index is None:
+            index = request_index[request] = len(requests)
+            requests.append({'key': [list(request.key[0]), list(request.key[1])],
+                             'start': [request.start.x, request.start.y], 'goal': [request.goal.x, request.goal.y],
+                             'done': request.done, 'path': [[point.x, point.y] for point in request.path]})
+        return index
+
+    food_index = {food: index for index, food in enumerate(world.food)}
+    positions, holders, radii = array('d'), array('q'), array('q')
+    for food in world.food:
+        positions.extend((food.position.x, food.position.y))
+        holders.append(NONE if food.holder_id is None else food.holder_id)
+        radii.append(food.radius)
+    arrays['food.position'], arrays['food.holder'], arrays['food.radius'] = positions, holders, radii
+    arrays['food.grid_cells'], arrays['food.grid_items'] = grid_order(world.food_grid, food_index.__getitem__)
+
+    groups = []
+    for prefix, group in (('group1.', world.group1), ('group2.', world.group2)):
+        columns = {name: array('q') for name in ('id', 'health', 'enemy', 'food', 'request', 'path_length')}
+        columns.update({name: array('b') for name in ('king', 'alive', 'mode')})
+        columns.update({name: array('d') for name in ('position', 'velocity', 'wander_target', 'max_speed', 'target',
+                                                       'world_target', 'path')})
+        for agent in group.agents:
+            columns['id'].append(agent.id)
+            columns['king'].append(isinstance(agent, KingAgent))
+            columns['alive'].append(agent.alive)
+            columns['mode'].append(MODE_CODES[agent.mode])
+            columns['health'].append(agent.health)
+            add_vector(columns['position'], agent.position)
+            add_vector(columns['velocity'], agent.velocity)
+            add_vector(columns['wander_target'], agent.wander_target)
+            columns['max_speed'].append(agent.base_max_speed)
+            columns['enemy'].append(NONE if agent.enemy_id is None else agent.enemy_id)
+            columns['food'].append(NONE if agent.carrying_food is None else food_index[agent.carrying_food])
+            add_vector(columns['target'], agent.target)
+            add_vector(columns['world_target'], agent.world_target)
+            columns['path_length'].append(len(agent.path))
+            for point in agent.path:
+                add_vector(columns['path'], point)
+            columns['request'].append(add_request(agent.path_request))
+        for name, values in columns.items():
+            arrays[prefix + name] = values
+        arrays[prefix + 'grid_cells'], arrays[prefix + 'grid_items'] = grid_order(world.agent_grids[group],
+                                                                                  lambda agent: agent.id)
+
+        engine = group.engine
+        if engine is not None:
+            # has_enemy can outlive the enemy itself, and the hash cells decide which rows get re-bucketed
+            arrays[prefix + 'has_enemy'] = array('b', engine.has_enemy[:engine.count].tolist())
+            arrays[prefix + 'cells'] = array('q', engine.cells.ravel().tolist())
+        groups.append({
+            'weights': [getattr(group, name) for name in WEIGHTS],
+            'max_speed': group.max_speed,
+            'goal': group.goal,
+            'world_target': None if group.world_target is None else [group.world_target.x, group.world_target.y],
+            'food_delivered': group.food_delivered,
+            'dead': [agent.id for agent in group.dead],
+            'engine_rng': None if engine is None else engine.rng.bit_generator.state,
+        })
+
+    gauss = {}
+    for name in STREAMS:
+        version, internal, gauss[name] = getattr(world.rng, name).getstate()
+        arrays['rng.' + name] = array('q', internal)
+
+    meta = {
+        'tick': world.tick,
+        'next_agent_id': world.next_agent_id,
+        'max_food_radius': world.max_food_radius,
+        'groups': groups,
+        'requests': requests,
+        'pending': [add_request(request) for request in world.path_planner.pending.values()],
+        'rng_version': version,
+        'gauss': gauss,
+    }
+    return arrays, meta
+
+
+def restore(world, arrays, meta):
+    ''' Put world (same parameters and seed as the captured one) back in the captured state '''
+    world.tick = meta['tick']
+
+    # Food first, agents point at it
+    positions, holders, radii = arrays['food.position'], arrays['food.holder'], arrays['food.radius']
+    count = len(holders)
+    while len(world.food) < count:
+        world.food.append(Food(world))
+    del world.food[count:]
+    for index, food in enumerate(world.food):
+        food.position.set(positions[2 * index], positions[2 * index + 1])
+        food.radius = radii[index]
+        food.holder_id = None if holders[index] == NONE else holders[index]
+        food.refresh_zone()
+    world.max_food_radius = meta['max_food_radius']
+    restore_grid(world.food_grid, arrays['food.grid_cells'], arrays['food.grid_items'], world.food.__getitem__)
+
+    requests = []
+    for saved in meta['requests']:
+        request = PathRequest((tuple(saved['key'][0]), tuple(saved['key'][1])), Vector2D(*saved['start']),
+                              Vector2D(*saved['goal']))
+        request.done = saved['done']
+        request.path = [Vector2D(x, y) for x, y in saved['path']]
+        requests.append(request)
+
+    world.agents_by_id.clear()
+    world.next_agent_id = meta['next_agent_id']  # Agents built below get throwaway ids above every saved one
+    for prefix, group, state in (('group1.', world.group1, meta['groups'][0]), ('group2.', world.group2, meta['groups'][1])):
+        restore_group(world, group, prefix, arrays, state, requests)
+    world.next_agent_id = meta['next_agent_id']
+
+    planner = world.path_planner
+    planner.pending = OrderedDict((requests[index].key, requests[index]) for index in meta['pending'])
+    planner.finished.clear()
+
+    for name in STREAMS:
+        getattr(world.rng, name).setstate((meta['rng_version'], tuple(arrays['rng.' + name]), meta['gauss'][name]))
+
+
+def restore_group(world, group, prefix, arrays, state, requests):
+    column = lambda name: arrays[prefix + name]
+    ids, kings, alive, modes, health = column('id'), column('king'), column('alive'), column('mode'), column('health')
+    position, velocity, wander_target = column('position'), column('velocity'), column('wander_target')
+    max_speed, enemy, food, target, world_target = (column('max_speed'), column('enemy'), column('food'),
+                                                    column('target'), column('world_target'))
+    path_length, path, request = column('path_length'), column('path'), column('request')
+
+    engine = group.engine
+    if engine is not None:
+        import numpy as np
+        from array_engine import ArrayAgent, ArrayKingAgent
+        agent_class, king_class = ArrayAgent, ArrayKingAgent
+        engine.agents = []
+        engine.count = 0
+    else:
+        agent_class, king_class = Agent, KingAgent
+    group.agents = []
+
+    agents_by_id = world.agents_by_id
+    point = 0
+    for row in range(len(ids)):
+        start = get_vector(position, row)
+        if kings[row]:
+            agent = king_class(world, start, group, group.king_zone, color=group.color)
+        else:
+            agent = agent_class(world, start, group, color=group.color)
+        del agents_by_id[agent.id]
+        agent.id = ids[row]
+        agents_by_id[agent.id] = agent
+        group.add(agent)
+
+        agent.mode = MODES[modes[row]]
+        agent.alive = bool(alive[row])
+        agent.health = health[row]
+        agent.velocity.set(velocity[2 * row], velocity[2 * row + 1])
+        agent.wander_target.set(wander_target[2 * row], wander_target[2 * row + 1])
+        agent.base_max_speed = max_speed[row]
+        agent.enemy_id = None if enemy[row] == NONE else enemy[row]
+        agent.carrying_food = None if food[row] == NONE else world.food[food[row]]
+        agent.target = get_vector(target, row)
+        agent.world_target = get_vector(world_target, row)
+        agent.path = [get_vector(path, index) for index in range(point, point + path_length[row])]
+        point += path_length[row]
+        agent.path_request = None if request[row] == NONE else requests[request[row]]
+        if agent.path_request is not None:
+            agent.path_request.holders += 1
+
+    if engine is not None:
+        engine.has_enemy[:engine.count] = np.asarray(column('has_enemy'), dtype=np.bool_)
+        engine.cells = np.array(column('cells'), dtype=np.int64).reshape(-1, 2)
+        engine.rng.bit_generator.state = state['engine_rng']
+    restore_grid(world.agent_grids[group], column('grid_cells'), column('grid_items'), agents_by_id.__getitem__)
+
+    for name, value in zip(WEIGHTS, state['weights']):
+        setattr(group, name, value)
+    group.max_speed = state['max_speed']
+    group.goal = state['goal']
+    group.world_target = None if state['world_target'] is None else Vector2D(*state['world_target'])
+    group.food_delivered = state['food_delivered']
+    group.dead = [agents_by_id[agent_id] for agent_id in state['dead']]
+
+
+# Whole worlds ---------------------------------------------------------------------------------------------------------
+def snapshot(world):
+    arrays, meta = capture(world)
+    walls = array('q')
+    for wall in world.walls:
+        walls.extend(wall.rect)
+    arrays['walls'] = walls
+    arrays['grid'] = array('b', [cell for column in world.grid for cell in column])
+    planner = world.path_planner
+    meta['params'] = world.params
+    meta['planner'] = {'budget_ms': planner.budget_ms, 'max_plans': planner.max_plans}
+    return SNAPSHOT_MAGIC + pack(arrays, meta)
+
+
+def read_snapshot(data):
+    if bytes(data[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+        raise ValueError("Not a World snapshot")
+    return unpack(memoryview(data)[len(SNAPSHOT_MAGIC):])
+
+
+def saved_walls(arrays):
+    walls = arrays['walls']
+    return [tuple(walls[index:index + 4]) for index in range(0, len(walls), 4)]
+
+
+def load(world_class, data):
+    ''' A new world_class (World) in the state snapshot() saved '''
+    arrays, meta = read_snapshot(data)
+    params = meta['params']
+    world = world_class(params['width'], params['height'], engine=params['engine'], num_agents=params['num_agents'],
+                        cell_size=params['cell_size'], path_mode=params['path_mode'], seed=params['seed'],
+                        walls=saved_walls(arrays))
+    restore_snapshot(world, arrays, meta)
+    return world
+
+
+def restore_snapshot(world, arrays, meta):
+    ''' In place, world has to be on the same map (same size, walls and path grid cell size) and
+    use the same engine as the snapshot '''
+    for name in COMPATIBLE_PARAMS:
+        if meta['params'][name] != world.params[name]:
+            raise ValueError(f"Snapshot has {name} {meta['params'][name]!r}, this world {world.params[name]!r}, "
+                             "use World.from_snapshot")
+    if len(arrays['grid']) != world.grid_width * world.grid_height:
+        raise ValueError("Snapshot's path grid doesn't match this world's, use World.from_snapshot")
+    if saved_walls(arrays) != [tuple(wall.rect) for wall in world.walls]:
+        raise ValueError("Snapshot is of a different map, use World.from_snapshot")
+    grid, height = arrays['grid'], world.grid_height
+    changed = False
+    for x, column in enumerate(world.grid):
+        saved = list(grid[x * height:(x + 1) * height])
+        if column != saved:
+            column[:] = saved
+            changed = True
+    if changed:
+        world.grid_changed()
+
+    planner = world.path_planner
+    planner.budget_ms = meta['planner']['budget_ms']
+    planner.max_plans = meta['planner']['max_plans']
+    restore(world, arrays, meta)